@@ -61,6 +61,12 @@ class _AddExpenseScreenState extends State<AddExpenseScreen> {
       final tags = formData['tags'] as List<expense_pb.Tag>;
       request.tagIds.addAll(tags.map((t) => t.id));
 
+      // OCR text of the scanned document, so the expense is found by its contents
+      final documentText = widget.documentResponse?.rawText;
+      if (documentText != null && documentText.isNotEmpty) {
+        request.documentText = documentText;
+      }
+
       final response = await _expenseService.createExpense(request);
 
       if (mounted) {
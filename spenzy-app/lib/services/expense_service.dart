@@ -21,6 +21,26 @@ class ExpenseService {
   late final expense.ExpenseServiceClient _client;
   final _serviceAuth = ServiceAuth();
 
+  // Trailer in which the service returns the database position of a write.
+  // Sending the latest one back keeps reads off a replica that has not
+  // caught up with this client's own writes yet.
+  static const String readAfterLsnKey = 'read-after-lsn';
+  String? _readAfterLsn;
+
+  CallOptions _callOptions(String token) {
+    return CallOptions(metadata: {
+      'authorization': 'Bearer $token',
+      if (_readAfterLsn != null) readAfterLsnKey: _readAfterLsn!,
+    });
+  }
+
+  Future<T> _write<T>(ResponseFuture<T> call) async {
+    final response = await call;
+    final position = (await call.trailers)[readAfterLsnKey];
+    if (position != null) _readAfterLsn = position;
+    return response;
+  }
+
   Future<void> dispose() async {
     await _channel.shutdown();
   }
@@ -51,9 +71,7 @@ class ExpenseService {
 
       final response = await _client.listExpenses(
         request,
-        options: CallOptions(metadata: {
-          'authorization': 'Bearer $token',
-        }),
+        options: _callOptions(token),
       );
       return response.expenses;
     } catch (e) {
@@ -66,12 +84,10 @@ class ExpenseService {
       final token = await _serviceAuth.getServiceToken('spenzy-expense.service');
       if (token == null) throw Exception('Not authenticated');
 
-      final response = await _client.createExpense(
+      final response = await _write(_client.createExpense(
         request,
-        options: CallOptions(metadata: {
-          'authorization': 'Bearer $token',
-        }),
-      );
+        options: _callOptions(token),
+      ));
       return response.expense;
     } catch (e) {
       throw Exception('Failed to create expense: $e');
@@ -83,12 +99,10 @@ class ExpenseService {
       final token = await _serviceAuth.getServiceToken('spenzy-expense.service');
       if (token == null) throw Exception('Not authenticated');
 
-      final response = await _client.updateExpense(
+      final response = await _write(_client.updateExpense(
         request,
-        options: CallOptions(metadata: {
-          'authorization': 'Bearer $token',
-        }),
-      );
+        options: _callOptions(token),
+      ));
       return response;
     } catch (e) {
       throw Exception('Failed to update expense: $e');
@@ -103,12 +117,10 @@ class ExpenseService {
       final request = expense.DeleteExpenseRequest()
         ..id = id;
 
-      await _client.deleteExpense(
+      await _write(_client.deleteExpense(
         request,
-        options: CallOptions(metadata: {
-          'authorization': 'Bearer $token',
-        }),
-      );
+        options: _callOptions(token),
+      ));
     } catch (e) {
       throw Exception('Failed to delete expense: $e');
     }
@@ -124,9 +136,7 @@ class ExpenseService {
 
       final response = await _client.getExpense(
         request,
-        options: CallOptions(metadata: {
-          'authorization': 'Bearer $token',
-        }),
+        options: _callOptions(token),
       );
       return response.expense;
     } catch (e) {
@@ -1,12 +1,24 @@
+import asyncio
 import os
 import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Callable, Dict, Optional
+from uuid import uuid4
+import asyncpg
+from sqlalchemy import Computed, exc, func, inspect, make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Table
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Table, Index, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.schema import CreateColumn
+from app import metrics
+from app.partitions import ensure_partitions, is_partitioned
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,15 +33,111 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', '1234')
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# Connection pool settings, tunable per deployment
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', True)
+DB_ECHO = _env_bool('DB_ECHO', False)
+# Prepared statements cached per connection by asyncpg and by SQLAlchemy's
+# asyncpg dialect
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+# PgBouncer in transaction mode hands each transaction a different server
+# connection, so server-side prepared statements cannot be reused there
+DB_PGBOUNCER = _env_bool('DB_PGBOUNCER', False)
+
 logger.info(f"Connecting to database at: {DB_HOST}:{DB_PORT}/{DB_NAME}")
 
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a connection,
+    including the time to open one when the pool grows."""
+
+    # A named parameter rather than a keyword-only one, so create_engine()
+    # recognizes it as a pool argument
+    def __init__(self, creator, metrics_prefix: str = 'db.pool', **kwargs):
+        super().__init__(creator, **kwargs)
+        self.metrics_prefix = metrics_prefix
+
+    def recreate(self):
+        # QueuePool.recreate() only passes on the arguments it knows about
+        pool = super().recreate()
+        pool.metrics_prefix = self.metrics_prefix
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.increment(f'{self.metrics_prefix}.checkout_timeouts')
+            raise
+        finally:
+            metrics.observe(f'{self.metrics_prefix}.checkout_wait', time.perf_counter() - started)
+
+
+def _connect_args() -> dict:
+    if DB_PGBOUNCER:
+        return {
+            'statement_cache_size': 0,
+            # Unique names keep unnamed statements from clashing when PgBouncer
+            # moves the session to another server connection
+            'prepared_statement_name_func': lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return {'statement_cache_size': DB_STATEMENT_CACHE_SIZE}
+
+
+def _create_engine(url: str, metrics_prefix: str):
+    """Create an async engine with the configured pool and register its gauges."""
+    created = create_async_engine(
+        make_url(url).update_query_dict({
+            'prepared_statement_cache_size': str(0 if DB_PGBOUNCER else DB_STATEMENT_CACHE_SIZE)
+        }),
+        echo=DB_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
+        # Passed on to InstrumentedPool
+        metrics_prefix=metrics_prefix
+    )
+
+    # Pool usage gauges, read whenever metrics are reported; dispose() swaps
+    # in a new pool, so look it up on the engine each time
+    def pool():
+        return created.sync_engine.pool
+    metrics.register_gauge(f'{metrics_prefix}.size', lambda: pool().size())
+    metrics.register_gauge(f'{metrics_prefix}.in_use', lambda: pool().checkedout())
+    metrics.register_gauge(f'{metrics_prefix}.idle', lambda: pool().checkedin())
+    metrics.register_gauge(f'{metrics_prefix}.overflow', lambda: max(pool().overflow(), 0))
+    return created
+
+
 # Create async SQLAlchemy engine
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    pool_size=5,
-    max_overflow=10
-)
+engine = _create_engine(DATABASE_URL, 'db.pool')
+
+# Optional streaming replica for read-only queries, same credentials and database
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST')
+DB_REPLICA_PORT = os.getenv('DB_REPLICA_PORT', DB_PORT)
+# How long reads stay on the primary after a user's write, so they see it
+DB_REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '5'))
+# Replay lag beyond which the replica is skipped
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '2'))
+
+replica_engine = None
+if DB_REPLICA_HOST:
+    logger.info(f"Routing reads to replica at: {DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}")
+    replica_engine = _create_engine(
+        f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}",
+        'db.replica_pool'
+    )
 
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
@@ -38,6 +146,12 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+ReplicaSessionLocal = sessionmaker(
+    replica_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+) if replica_engine is not None else None
+
 # Create declarative base
 Base = declarative_base()
 
@@ -63,8 +177,11 @@ class Tag(Base):
     __tablename__ = "tags"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(50), nullable=False, unique=True)
+    name = Column(String(50), nullable=False)
     user_id = Column(String(255), nullable=False)  # Owner of the tag
+    # Number of expenses carrying the tag, kept up to date by the writes that
+    # change expense_tags so autocomplete can rank by it without counting links
+    usage_count = Column(Integer, nullable=False, default=0, server_default='0')
     
     # Audit fields
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
@@ -72,49 +189,466 @@ class Tag(Base):
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     updated_by = Column(String(255), nullable=False)
 
+    __table_args__ = (
+        # Tag names are unique per user; bulk tag upserts conflict on this
+        Index('ux_tags_user_id_name', 'user_id', 'name', unique=True),
+        # Tag autocomplete: prefix matches within a user's tags, and substring
+        # matches through trigrams; the GIN index leads with user_id (needs the
+        # pg_trgm and btree_gin extensions, see init_db)
+        Index('ix_tags_user_name_prefix', 'user_id', text('lower(name) varchar_pattern_ops')),
+        Index('ix_tags_user_name_trgm', 'user_id', text('lower(name) gin_trgm_ops'), postgresql_using='gin'),
+    )
+
 # Create expense_tags association table
 expense_tags = Table(
     'expense_tags',
     Base.metadata,
-    Column('expense_id', Integer, ForeignKey('expenses.id', ondelete='CASCADE')),
+    # No foreign key: expenses is partitioned, and its unique constraints must
+    # include expense_date. Deleting an expense deletes its links explicitly.
+    Column('expense_id', Integer),
     Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE')),
+    Index('ix_expense_tags_expense_id', 'expense_id'),
+    Index('ix_expense_tags_tag_id_expense_id', 'tag_id', 'expense_id'),
 )
 
 # Create Expense model
 class Expense(Base):
     __tablename__ = "expenses"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # The table's primary key includes the partition key, see app.partitions;
+    # id alone stays unique and identifies expenses for the ORM
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(String(255), nullable=False)  # Owner of the expense
-    expense_date = Column(DateTime, nullable=False)
+    expense_date = Column(DateTime, primary_key=True)
     vendor_name = Column(String, nullable=False)
     total_amount = Column(Float, nullable=False)
     total_tax = Column(Float, nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
     currency = Column(String, nullable=False)
-    is_paid = Column(Boolean, default=False)
+    is_paid = Column(Boolean, default=False, server_default=text('false'), nullable=False)
     paid_on = Column(DateTime, nullable=True)
     due_date = Column(DateTime, nullable=True)  # Due date for the expense
+    # OCR text of the receipt the expense was created from, for full-text search
+    document_text = deferred(Column(Text, nullable=True))
+    # Vendor name (weight A) and document text (weight B), kept by Postgres
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('simple', coalesce(vendor_name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(document_text, '')), 'B')",
+            persisted=True
+        )
+    ))
     
-    # Audit fields
-    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    # Audit fields, stamped by the database clock like the tombstones' deleted_at,
+    # so sync watermarks compare timestamps from a single clock
+    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
     created_by = Column(String(255), nullable=False)  # Who created the record (user/system/agent)
-    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
     updated_by = Column(String(255), nullable=False)  # Who last modified the record (user/system/agent)
 
     # Relationships
     category = relationship("Category", back_populates="expenses")
-    tags = relationship("Tag", secondary=expense_tags, lazy="joined")
+    # Loaded with one batched IN query per statement rather than a join, so
+    # LIMIT/OFFSET apply to expenses and rows on the wire don't multiply by tags
+    tags = relationship(
+        "Tag",
+        secondary=expense_tags,
+        primaryjoin="Expense.id == foreign(expense_tags.c.expense_id)",
+        secondaryjoin="Tag.id == foreign(expense_tags.c.tag_id)",
+        lazy="selectin"
+    )
+
+    __mapper_args__ = {'primary_key': [id]}
+
+    # Composite (user_id, <sort column>, id) indexes backing sorting and keyset pagination
+    __table_args__ = (
+        Index('ix_expenses_user_expense_date_id', 'user_id', 'expense_date', 'id'),
+        Index('ix_expenses_user_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_expenses_user_updated_at_id', 'user_id', 'updated_at', 'id'),  # also SyncExpenses
+        Index('ix_expenses_user_total_amount_id', 'user_id', 'total_amount', 'id'),
+        Index('ix_expenses_user_vendor_name_id', 'user_id', 'vendor_name', 'id'),
+        # Indexes backing the ListExpensesRequest.filters predicates
+        Index('ix_expenses_user_category_expense_date', 'user_id', 'category_id', 'expense_date'),
+        Index('ix_expenses_user_currency_expense_date', 'user_id', 'currency', 'expense_date'),
+        # Category-wide lookups across users: the in-use probe and the
+        # foreign key check on category delete, and category merges
+        Index('ix_expenses_category_id', 'category_id'),
+        Index(
+            'ix_expenses_user_unpaid_expense_date', 'user_id', 'expense_date', 'id',
+            postgresql_where=text('is_paid = false')
+        ),
+        Index(
+            'ix_expenses_user_due_date', 'user_id', 'due_date',
+            postgresql_where=text('due_date IS NOT NULL')
+        ),
+        # Covering index letting date-bounded summaries run as index-only scans
+        Index(
+            'ix_expenses_user_summary', 'user_id', 'expense_date',
+            postgresql_include=['category_id', 'currency', 'total_amount', 'total_tax', 'is_paid']
+        ),
+        Index(
+            'ix_expenses_user_vendor_prefix', 'user_id', text('lower(vendor_name) varchar_pattern_ops')
+        ),
+        # Full-text search within one user's expenses (user_id needs btree_gin)
+        Index('ix_expenses_user_search', 'user_id', 'search_vector', postgresql_using='gin'),
+        # Monthly partitions, so date-bounded queries only scan the months they cover
+        {'postgresql_partition_by': 'RANGE (expense_date)'},
+    )
+
+# Create expense_counters table
+class ExpenseCounter(Base):
+    """Per-user expense counts, overall and per filter dimension.
+
+    Rows are keyed by (user_id, dimension, key): dimension 'all' with an empty
+    key holds the user's total, 'is_paid' uses 'true'/'false' keys and
+    'category_id' uses the category id as its key.
+    """
+    __tablename__ = "expense_counters"
+
+    user_id = Column(String(255), primary_key=True)
+    dimension = Column(String(32), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# Create expense_daily_rollups table
+class ExpenseDailyRollup(Base):
+    """Per-user daily spend per category and currency.
+
+    Maintained with delta upserts by every expense write so that summaries
+    read a handful of rollup rows instead of the user's whole history.
+    """
+    __tablename__ = "expense_daily_rollups"
+
+    user_id = Column(String(255), primary_key=True)
+    day = Column(Date, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    currency = Column(String, primary_key=True)
+    sum_amount = Column(Float, nullable=False, default=0)
+    sum_tax = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    unpaid_amount = Column(Float, nullable=False, default=0)
+    unpaid_count = Column(Integer, nullable=False, default=0)
+
+# Create expense_tombstones table
+class ExpenseTombstone(Base):
+    """One row per deleted expense, so delta syncs can tell clients to drop it.
+
+    Kept for EXPENSE_TOMBSTONE_RETENTION_DAYS; clients whose sync watermark is
+    older than that have to resync from scratch.
+    """
+    __tablename__ = "expense_tombstones"
+
+    # The id of the deleted expense, never generated here
+    expense_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(String(255), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('ix_expense_tombstones_user_deleted_at_id', 'user_id', 'deleted_at', 'expense_id'),
+    )
+
+# Create expense_dates table
+class ExpenseDate(Base):
+    """The expense_date of every expense, by id.
+
+    expenses is partitioned by expense_date, so finding an expense by id
+    alone probes every partition; looking its date up here first lets
+    Postgres visit only the partition holding it.
+    """
+    __tablename__ = "expense_dates"
+
+    expense_id = Column(Integer, primary_key=True, autoincrement=False)
+    expense_date = Column(DateTime, nullable=False)
+
+# Create expense_collection_versions table
+class ExpenseCollectionVersion(Base):
+    """Per-user counter bumped by every write to the user's expenses.
+
+    Lets ListExpenses answer a request whose if_none_match still matches
+    with one primary key lookup instead of the listing query.
+    """
+    __tablename__ = "expense_collection_versions"
+
+    user_id = Column(String(255), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
 
 # Create all tables
 async def init_db():
     async with engine.begin() as conn:
+        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        await conn.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gin'))
         await conn.run_sync(Base.metadata.create_all)
+        # create_all only builds columns and indexes together with new tables,
+        # so make sure those added to existing tables are created as well
+        added = await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        # Tag names used to be unique across all users
+        await conn.execute(text('ALTER TABLE tags DROP CONSTRAINT IF EXISTS tags_name_key'))
+        # The trigram index used to span all users' tags
+        await conn.execute(text('DROP INDEX IF EXISTS ix_tags_name_trgm'))
+        if ('tags', 'usage_count') in added:
+            await _backfill_tag_usage(conn)
+        # Tombstone ids used to be created as SERIAL, with a sequence of their own
+        await conn.execute(text('ALTER TABLE expense_tombstones ALTER COLUMN expense_id DROP DEFAULT'))
+        await conn.execute(text('DROP SEQUENCE IF EXISTS expense_tombstones_expense_id_seq'))
+        await _require_is_paid(conn)
+        await _backfill_expense_dates(conn)
+        # New databases get a partitioned expenses table, which needs partitions
+        # before any insert; existing ones are converted with manage.py
+        if await is_partitioned(conn):
+            await ensure_partitions(conn)
+        else:
+            logger.warning("expenses is not partitioned yet, run: python manage.py partition-expenses")
+
+async def maintain_partitions(interval: float = 86400) -> None:
+    """Keep creating the upcoming monthly expense partitions until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.begin() as conn:
+                await ensure_partitions(conn)
+        except Exception as e:
+            logger.error(f"Failed to create expense partitions: {str(e)}", exc_info=True)
+
+async def _require_is_paid(connection) -> None:
+    """Turn legacy NULL is_paid values into false and forbid new ones.
+
+    Counters and rollups always treated NULL as unpaid while the is_paid
+    filter did not match it, so the two disagreed on those rows.
+    """
+    nullable = await connection.scalar(text(
+        "SELECT is_nullable = 'YES' FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'expenses' AND column_name = 'is_paid'"
+    ))
+    if not nullable:
+        return
+    result = await connection.execute(text('UPDATE expenses SET is_paid = false WHERE is_paid IS NULL'))
+    await connection.execute(text(
+        'ALTER TABLE expenses ALTER COLUMN is_paid SET DEFAULT false, ALTER COLUMN is_paid SET NOT NULL'
+    ))
+    logger.info(f"Set is_paid to false on {result.rowcount} expenses and made it NOT NULL")
+
+async def _backfill_expense_dates(connection) -> None:
+    """Fill expense_dates from expenses when it was just created next to existing expenses."""
+    if await connection.scalar(text('SELECT EXISTS (SELECT 1 FROM expense_dates)')):
+        return
+    result = await connection.execute(text(
+        'INSERT INTO expense_dates (expense_id, expense_date) SELECT id, expense_date FROM expenses'
+    ))
+    if result.rowcount:
+        logger.info(f"Recorded the dates of {result.rowcount} expenses in expense_dates")
+
+async def _backfill_tag_usage(connection) -> None:
+    """Count the links of every tag once, when usage_count was just added to tags."""
+    result = await connection.execute(text(
+        'UPDATE tags SET usage_count = links.count FROM '
+        '(SELECT tag_id, count(*) AS count FROM expense_tags GROUP BY tag_id) AS links '
+        'WHERE tags.id = links.tag_id'
+    ))
+    if result.rowcount:
+        logger.info(f"Counted the expenses of {result.rowcount} tags")
+
+def _add_missing_columns(connection):
+    """Add model columns missing from existing tables; returns the (table, column) names added."""
+    added = []
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                added.append((table.name, column.name))
+    return added
+
+def _create_missing_indexes(connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+async def listen(
+    channel: str,
+    on_notify: Callable[[str], None],
+    on_connect: Callable[[], None],
+    reconnect_delay: float = 5.0
+) -> None:
+    """Call on_notify with the payload of every NOTIFY on channel until cancelled.
+
+    Uses a dedicated connection outside the pool, since LISTEN needs a
+    session that stays open. Notifications sent while disconnected are lost,
+    so on_connect is called on every (re)connect to let the caller catch up.
+    """
+    url = engine.url
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(
+                user=url.username,
+                password=url.password,
+                host=url.host,
+                port=url.port,
+                database=url.database
+            )
+            await connection.add_listener(channel, lambda conn, pid, chan, payload: on_notify(payload))
+            on_connect()
+            logger.info(f"Listening for notifications on {channel}")
+
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await closed.wait()
+            logger.warning(f"Listener on {channel} disconnected")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Listener on {channel} failed: {str(e)}", exc_info=True)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(reconnect_delay)
+
+# Metadata key of the primary's WAL position after a write, sent to the client
+# in the trailers of every write RPC. Clients send it back with later calls,
+# and whichever server process handles them keeps their reads off a replica
+# that has not replayed that far yet.
+READ_AFTER_LSN_KEY = 'read-after-lsn'
+
+# Replica routing state: last measured replay lag and replayed WAL position
+# (None until measured or when the replica is unreachable) and when each
+# recent writer's reads may leave the primary again. The latter only covers
+# writes made through this process, for clients not sending READ_AFTER_LSN_KEY.
+_replica_lag: Optional[float] = None
+_replica_replay_lsn: Optional[int] = None
+_sticky_until: Dict[str, float] = {}
+
+def parse_lsn(value: str) -> int:
+    """Byte position of a WAL position written as text, such as '16/B374D848'."""
+    high, low = value.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+async def write_position(session) -> Optional[str]:
+    """The primary's WAL position once the session's writes have committed.
+
+    Meant for the READ_AFTER_LSN_KEY trailer; None without a replica.
+    """
+    if replica_engine is None:
+        return None
+    return await session.scalar(text('SELECT pg_current_wal_insert_lsn()::text'))
+
+def record_write(user_id: str) -> None:
+    """Keep the user's reads on the primary for DB_REPLICA_STICKY_SECONDS."""
+    if replica_engine is None:
+        return
+    now = time.monotonic()
+    _sticky_until[user_id] = now + DB_REPLICA_STICKY_SECONDS
+    # Drop expired entries now and then so the map stays bounded by recent writers
+    if len(_sticky_until) > 10000:
+        for key in [key for key, until in _sticky_until.items() if until <= now]:
+            del _sticky_until[key]
+
+def is_replica_session(session) -> bool:
+    """Whether the session reads from the replica rather than the primary."""
+    return replica_engine is not None and session.bind is replica_engine
+
+def use_replica(user_id: Optional[str], read_after: Optional[str] = None) -> bool:
+    """Whether a read for this user may be served by the replica.
+
+    read_after is the READ_AFTER_LSN_KEY value the client sent, if any.
+    """
+    if replica_engine is None:
+        return False
+    if _replica_lag is None or _replica_lag > DB_REPLICA_MAX_LAG_SECONDS:
+        metrics.increment('db.replica.lag_fallbacks')
+        return False
+    if read_after:
+        try:
+            behind = _replica_replay_lsn is None or _replica_replay_lsn < parse_lsn(read_after)
+        except ValueError:
+            behind = True
+        if behind:
+            metrics.increment('db.replica.position_fallbacks')
+            return False
+    if user_id and _sticky_until.get(user_id, 0) > time.monotonic():
+        metrics.increment('db.replica.sticky_fallbacks')
+        return False
+    metrics.increment('db.replica.reads')
+    return True
+
+async def monitor_replica_lag(interval: float = 1.0) -> None:
+    """Measure the replica's replay lag and position every interval seconds until cancelled.
+
+    An idle primary sends no WAL, so a replica that has replayed everything
+    it received counts as zero lag rather than as time since the last commit.
+    """
+    global _replica_lag, _replica_replay_lsn
+    if replica_engine is None:
+        return
+    metrics.register_gauge('db.replica.lag_seconds', lambda: -1 if _replica_lag is None else _replica_lag)
+    stmt = text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, "
+        "pg_last_wal_replay_lsn()::text"
+    )
+    while True:
+        try:
+            async with replica_engine.connect() as conn:
+                lag, replayed = (await conn.execute(stmt)).one()
+            _replica_lag = float(lag) if lag is not None else None
+            _replica_replay_lsn = parse_lsn(replayed) if replayed is not None else None
+        except Exception as e:
+            logger.warning(f"Replica lag check failed: {str(e)}")
+            _replica_lag = None
+            _replica_replay_lsn = None
+        await asyncio.sleep(interval)
+
+# Session shared by everything that runs within one RPC, see request_session
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar('request_session', default=None)
+
+@asynccontextmanager
+async def request_session(read_only: bool = False, user_id: Optional[str] = None, read_after: Optional[str] = None):
+    """Open a session that every get_db() call in the current context reuses.
+
+    Read-only requests are served by the replica when use_replica allows it.
+    The caller owns the unit of work: it commits or rolls back once at the
+    end, and the session is closed (rolling back anything left) on exit.
+    """
+    session = ReplicaSessionLocal() if read_only and use_replica(user_id, read_after) else AsyncSessionLocal()
+    token = _request_session.set(session)
+    try:
+        yield session
+    finally:
+        _request_session.reset(token)
+        await session.close()
+
+async def commit(session: AsyncSession) -> None:
+    """Commit a service's changes, or only flush them when the session is the
+    request's unit of work, which is committed once when the RPC finishes.
+    Either way the session is marked as having written, see has_written."""
+    session.info['written'] = True
+    if session is _request_session.get():
+        await session.flush()
+    else:
+        await session.commit()
+
+def has_written(session: AsyncSession) -> bool:
+    """Whether a service committed changes through the session."""
+    return session.info.get('written', False)
 
 # Get database session
-async def get_db():
-    async with AsyncSessionLocal() as session:
+async def get_db(read_only: bool = False, user_id: Optional[str] = None):
+    """Yield the request's session, or a session of its own outside a request.
+
+    Outside a request, read_only callers passing the user they read for may
+    be given a replica session; see use_replica.
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+
+    session_factory = ReplicaSessionLocal if read_only and use_replica(user_id) else AsyncSessionLocal
+    async with session_factory() as session:
         try:
             yield session
         finally:
-            await session.close() 
\ No newline at end of file
+            await session.close()
@@ -3,6 +3,7 @@ from google.protobuf.timestamp_pb2 import Timestamp
 from proto import expense_pb2, expense_pb2_grpc
 from app.services.category_service import CategoryService
 from app.models.category import CategoryCreate, CategoryUpdate
+from spenzy_common.utils.token_utils import get_user_id_from_context
 
 class CategoryServicer(expense_pb2_grpc.CategoryServiceServicer):
     def __init__(self):
@@ -115,4 +116,34 @@ class CategoryServicer(expense_pb2_grpc.CategoryServiceServicer):
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(str(e))
-            return expense_pb2.DeleteCategoryResponse(success=False) 
\ No newline at end of file
+            return expense_pb2.DeleteCategoryResponse(success=False)
+
+    async def MergeCategories(self, request, context):
+        """Move all expenses of one category to another and delete the first."""
+        try:
+            user_id = get_user_id_from_context(context)
+            moved = await self.category_service.merge_categories(
+                request.source_category_id,
+                request.target_category_id,
+                user_id
+            )
+            if moved is None:
+                context.set_code(grpc.StatusCode.NOT_FOUND)
+                context.set_details(
+                    f"Category {request.source_category_id} or {request.target_category_id} not found"
+                )
+                return expense_pb2.MergeCategoriesResponse(success=False)
+
+            return expense_pb2.MergeCategoriesResponse(moved_count=moved, success=True)
+        except PermissionError as e:
+            context.set_code(grpc.StatusCode.PERMISSION_DENIED)
+            context.set_details(str(e))
+            return expense_pb2.MergeCategoriesResponse(success=False, error_message=str(e))
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return expense_pb2.MergeCategoriesResponse(success=False, error_message=str(e))
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return expense_pb2.MergeCategoriesResponse(success=False, error_message=str(e))
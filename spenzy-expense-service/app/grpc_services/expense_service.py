@@ -7,12 +7,16 @@ from google.protobuf.timestamp_pb2 import Timestamp
 from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 from proto import expense_pb2, expense_pb2_grpc
-from app.services.expense_service import ExpenseService
+from app.services.expense_events import expense_change_hub
+from app.services.expense_export import export_expenses
+from app.services.expense_service import DEFAULT_FIELDS, ExpenseService, read_fields
+from app.services.expense_versions import expense_version_token
 from app.services.category_service import CategoryService
+from app.services.summary_service import SummaryService
 from app.models.expense import ExpenseCreate, ExpenseUpdate
 from spenzy_common.middleware.auth_interceptor import AuthInterceptor
 from spenzy_common.utils.token_utils import get_user_id_from_context
-from app.database import get_db, Expense, Category
+from app.database import READ_AFTER_LSN_KEY, get_db, record_write, write_position, Expense, Category
 
 # Configure logging
 logging.basicConfig(
@@ -21,6 +25,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Rows per transaction for client-streamed bulk creation
+BULK_CREATE_CHUNK_SIZE = 1000
+
+# Most expenses a ListExpenses page or a StreamExpenses message carries
+MAX_PAGE_SIZE = 5000
+
+# Expense proto fields copied from rows as they are, and timestamp fields
+SCALAR_FIELDS = (
+    'id', 'user_id', 'vendor_name', 'total_amount', 'total_tax', 'category_id', 'currency',
+    'created_by', 'updated_by'
+)
+TIMESTAMP_FIELDS = ('expense_date', 'paid_on', 'created_at', 'updated_at', 'due_date')
+
 def timestamp_to_datetime(ts):
     """Convert Protobuf Timestamp to Python datetime."""
     return datetime.fromtimestamp(ts.seconds + ts.nanos / 1e9)
@@ -35,59 +52,165 @@ class ExpenseServicer(expense_pb2_grpc.ExpenseServiceServicer):
     def __init__(self):
         self.expense_service = ExpenseService()
         self.category_service = CategoryService()
-
-    def _expense_to_proto(self, expense):
-        """Convert expense model to protobuf message."""
-        if not expense:
-            return None
-
-        expense_proto = expense_pb2.Expense(
-            id=expense.id,
-            user_id=expense.user_id,
-            vendor_name=expense.vendor_name,
-            total_amount=expense.total_amount,
-            total_tax=expense.total_tax,
-            category_id=expense.category_id,
-            currency=expense.currency,
-            is_paid=expense.is_paid
+        self.summary_service = SummaryService()
+
+    def _rows_to_protos(self, rows, tags_by_expense, fields=DEFAULT_FIELDS):
+        """Convert ExpenseService rows to protobuf messages in one pass.
+
+        Only the requested fields (see read_fields) are set, so rows only need
+        their columns. Category submessages are built once per category id and
+        merged into each expense that references them.
+        """
+        scalars = [field for field in SCALAR_FIELDS if field in fields]
+        timestamps = [field for field in TIMESTAMP_FIELDS if field in fields]
+        categories = {}
+        expense_protos = []
+        for row in rows:
+            expense_proto = expense_pb2.Expense(**{field: getattr(row, field) for field in scalars})
+            if 'is_paid' in fields:
+                expense_proto.is_paid = bool(row.is_paid)
+            for field in timestamps:
+                value = getattr(row, field)
+                if value:
+                    getattr(expense_proto, field).FromDatetime(value)
+
+            if 'category' in fields:
+                category = categories.get(row.category_id)
+                if category is None:
+                    category = expense_pb2.Category(id=row.category_id, name=row.category_name)
+                    categories[row.category_id] = category
+                expense_proto.category.MergeFrom(category)
+
+            for tag_id, tag_name in tags_by_expense.get(row.id, ()):
+                expense_proto.tags.add(id=tag_id, name=tag_name)
+
+            expense_protos.append(expense_proto)
+        return expense_protos
+
+    def _create_request_to_model(self, request):
+        """Convert a CreateExpenseRequest to an ExpenseCreate model."""
+        return ExpenseCreate(
+            expense_date=request.expense_date.ToDatetime(),
+            vendor_name=request.vendor_name,
+            total_amount=request.total_amount,
+            total_tax=request.total_tax,
+            category_id=request.category_id,
+            currency=request.currency,
+            is_paid=request.is_paid,
+            paid_on=request.paid_on.ToDatetime() if request.HasField('paid_on') else None,
+            due_date=request.due_date.ToDatetime() if request.HasField('due_date') else None,
+            tag_ids=list(request.tag_ids),  # Convert tag_ids from the request to a list
+            document_text=request.document_text if request.HasField('document_text') else None
         )
 
-        # Handle timestamps
-        expense_date = timestamp_pb2.Timestamp()
-        expense_date.FromDatetime(expense.expense_date)
-        expense_proto.expense_date.CopyFrom(expense_date)
-
-        if expense.paid_on:
-            paid_on = timestamp_pb2.Timestamp()
-            paid_on.FromDatetime(expense.paid_on)
-            expense_proto.paid_on.CopyFrom(paid_on)
+    async def _create_expenses(self, user_id, requests, offset=0):
+        """Validate and bulk-create a chunk of CreateExpenseRequests.
+
+        Rows that fail conversion are reported without reaching the database.
+        Returns CreateExpenseResult messages indexed from offset.
+        """
+        results = [None] * len(requests)
+        models = []
+        positions = []
+        for index, request in enumerate(requests):
+            if not request.HasField('expense_date'):
+                error_msg = "expense_date is required"
+            elif not request.vendor_name:
+                error_msg = "vendor_name is required"
+            elif not request.currency:
+                error_msg = "currency is required"
+            else:
+                try:
+                    models.append(self._create_request_to_model(request))
+                    positions.append(index)
+                    continue
+                except ValueError as e:
+                    error_msg = str(e)
+            results[index] = expense_pb2.CreateExpenseResult(
+                index=offset + index, success=False, error_message=error_msg
+            )
 
-        if expense.due_date:
-            due_date = timestamp_pb2.Timestamp()
-            due_date.FromDatetime(expense.due_date)
-            expense_proto.due_date.CopyFrom(due_date)
+        created = await self.expense_service.create_expenses(user_id, models)
+        for index, (expense_id, error_msg) in zip(positions, created):
+            results[index] = expense_pb2.CreateExpenseResult(
+                index=offset + index,
+                id=expense_id or 0,
+                success=expense_id is not None,
+                error_message=error_msg or ""
+            )
+        return results
 
-        created_at = timestamp_pb2.Timestamp()
-        created_at.FromDatetime(expense.created_at)
-        expense_proto.created_at.CopyFrom(created_at)
+    async def CreateExpenses(self, request, context):
+        """Create a batch of expenses in one transaction."""
+        try:
+            user_id = get_user_id_from_context(context)
+            if not user_id:
+                error_msg = 'User ID not found in token'
+                logger.error(f"CreateExpenses failed: {error_msg}")
+                context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                context.set_details(error_msg)
+                return expense_pb2.CreateExpensesResponse(success=False, error_message=error_msg)
+
+            logger.info(f"CreateExpenses request - user_id: {user_id}, rows: {len(request.expenses)}")
+            results = await self._create_expenses(user_id, list(request.expenses))
+            return expense_pb2.CreateExpensesResponse(
+                results=results,
+                created_count=sum(1 for result in results if result.success),
+                success=True
+            )
 
-        updated_at = timestamp_pb2.Timestamp()
-        updated_at.FromDatetime(expense.updated_at)
-        expense_proto.updated_at.CopyFrom(updated_at)
+        except Exception as e:
+            error_msg = f"CreateExpenses failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.CreateExpensesResponse(success=False, error_message=error_msg)
 
-        # Handle category
-        if expense.category:
-            expense_proto.category.id = expense.category.id
-            expense_proto.category.name = expense.category.name
+    async def CreateExpensesStream(self, request_iterator, context):
+        """Create expenses sent over a client stream.
 
-        # Handle tags
-        if expense.tags:
-            for tag in expense.tags:
-                tag_proto = expense_proto.tags.add()
-                tag_proto.id = tag.id
-                tag_proto.name = tag.name
+        Rows are committed in chunks of BULK_CREATE_CHUNK_SIZE, each in its own
+        transaction, so arbitrarily long streams use bounded memory.
+        """
+        results = []
+        try:
+            user_id = get_user_id_from_context(context)
+            if not user_id:
+                error_msg = 'User ID not found in token'
+                logger.error(f"CreateExpensesStream failed: {error_msg}")
+                context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                context.set_details(error_msg)
+                return expense_pb2.CreateExpensesResponse(success=False, error_message=error_msg)
+
+            chunk = []
+            async for request in request_iterator:
+                chunk.append(request)
+                if len(chunk) >= BULK_CREATE_CHUNK_SIZE:
+                    results.extend(await self._create_expenses(user_id, chunk, len(results)))
+                    chunk = []
+            if chunk:
+                results.extend(await self._create_expenses(user_id, chunk, len(results)))
+            # Streams commit outside the session interceptor, which would
+            # otherwise keep the user's next reads on the primary
+            record_write(user_id)
+            async for session in get_db():
+                position = await write_position(session)
+            if position:
+                context.set_trailing_metadata(((READ_AFTER_LSN_KEY, position),))
+
+            return expense_pb2.CreateExpensesResponse(
+                results=results,
+                created_count=sum(1 for result in results if result.success),
+                success=True
+            )
 
-        return expense_proto
+        except Exception as e:
+            error_msg = f"CreateExpensesStream failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.CreateExpensesResponse(
+                results=results,
+                created_count=sum(1 for result in results if result.success),
+                success=False,
+                error_message=error_msg
+            )
 
     async def CreateExpense(self, request, context):
         """Create a new expense."""
@@ -103,30 +226,16 @@ class ExpenseServicer(expense_pb2_grpc.ExpenseServiceServicer):
             logger.info(f"CreateExpense request - user_id: {user_id}, vendor: {request.vendor_name}")
 
             # Create expense data
-            expense_data = ExpenseCreate(
-                expense_date=request.expense_date.ToDatetime(),
-                vendor_name=request.vendor_name,
-                total_amount=request.total_amount,
-                total_tax=request.total_tax,
-                category_id=request.category_id,
-                currency=request.currency,
-                is_paid=request.is_paid,
-                paid_on=request.paid_on.ToDatetime() if request.HasField('paid_on') else None,
-                due_date=request.due_date.ToDatetime() if request.HasField('due_date') else None,
-                tag_ids=list(request.tag_ids)  # Convert tag_ids from the request to a list
-            )
+            expense_data = self._create_request_to_model(request)
 
             # Create expense
-            expense = await self.expense_service.create_expense(user_id, expense_data)
-            if not expense:
-                error_msg = "Failed to create expense"
-                logger.error(f"CreateExpense failed: {error_msg}")
-                return expense_pb2.ExpenseResponse(success=False, error_message=error_msg)
+            row, tags = await self.expense_service.create_expense(user_id, expense_data)
 
             # Convert to proto and return
-            expense_proto = self._expense_to_proto(expense)
+            expense_proto = self._rows_to_protos([row], {row.id: tags})[0]
             return expense_pb2.ExpenseResponse(
                 expense=expense_proto,
+                version=await expense_version_token(row.updated_at),
                 success=True
             )
 
@@ -145,18 +254,31 @@ class ExpenseServicer(expense_pb2_grpc.ExpenseServiceServicer):
                 context.abort(grpc.StatusCode.UNAUTHENTICATED, error_msg)
                 return expense_pb2.ExpenseResponse(success=False, error_message=error_msg)
 
-            expense = await self.expense_service.get_expense(user_id, request.id)
-            if not expense:
+            fields = read_fields(request.read_mask.paths)
+            if request.if_none_match:
+                # Compare versions with a single-column lookup before loading anything
+                version = await self.expense_service.expense_version(user_id, request.id)
+                if version == request.if_none_match:
+                    return expense_pb2.ExpenseResponse(version=version, not_modified=True, success=True)
+
+            rows, tags_by_expense = await self.expense_service.get_expense_rows(user_id, [request.id], fields)
+            if not rows:
                 error_msg = f"Expense {request.id} not found"
                 logger.error(f"GetExpense failed: {error_msg}")
                 return expense_pb2.ExpenseResponse(success=False, error_message=error_msg)
 
-            expense_proto = self._expense_to_proto(expense)
             return expense_pb2.ExpenseResponse(
-                expense=expense_proto,
+                expense=self._rows_to_protos(rows, tags_by_expense, fields)[0],
+                version=await expense_version_token(rows[0].updated_at),
                 success=True
             )
 
+        except ValueError as e:
+            error_msg = f"GetExpense failed: {str(e)}"
+            logger.error(error_msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error_msg)
+            return expense_pb2.ExpenseResponse(success=False, error_message=error_msg)
         except Exception as e:
             error_msg = f"GetExpense failed: {str(e)}"
             logger.error(error_msg, exc_info=True)
@@ -172,27 +294,335 @@ class ExpenseServicer(expense_pb2_grpc.ExpenseServiceServicer):
                 context.abort(grpc.StatusCode.UNAUTHENTICATED, error_msg)
                 return expense_pb2.ListExpensesResponse(success=False, error_message=error_msg)
 
+            # Read the version before the page, so a write in between makes the
+            # returned version older than the data rather than newer
+            version = await self.expense_service.collection_version(user_id)
+            if request.if_none_match and request.if_none_match == version:
+                return expense_pb2.ListExpensesResponse(version=version, not_modified=True, success=True)
+
             # Get expenses
-            expenses = await self.expense_service.list_expenses(
+            fields = read_fields(request.read_mask.paths)
+            rows, tags_by_expense, next_page_token = await self.expense_service.list_expense_rows(
                 user_id=user_id,
                 page=request.page,
-                page_size=request.page_size,
+                page_size=min(request.page_size, MAX_PAGE_SIZE) if request.page_size > 0 else 10,
                 sort_by=request.sort_by if request.sort_by else 'expense_date',
-                ascending=request.ascending
+                ascending=request.ascending,
+                page_token=request.page_token or None,
+                filters=dict(request.filters),
+                fields=fields
             )
+            total_count = await self.expense_service.count_expenses(user_id, dict(request.filters))
 
             # Convert to proto messages
-            expense_protos = [self._expense_to_proto(expense) for expense in expenses if expense]
+            expense_protos = self._rows_to_protos(rows, tags_by_expense, fields)
             return expense_pb2.ListExpensesResponse(
                 expenses=expense_protos,
+                next_page_token=next_page_token or "",
+                total_count=total_count,
+                version=version,
                 success=True
             )
 
+        except ValueError as e:
+            error_msg = f"ListExpenses failed: {str(e)}"
+            logger.error(error_msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error_msg)
+            return expense_pb2.ListExpensesResponse(success=False, error_message=error_msg)
         except Exception as e:
             error_msg = f"ListExpenses failed: {str(e)}"
             logger.error(error_msg, exc_info=True)
             return expense_pb2.ListExpensesResponse(success=False, error_message=error_msg)
 
+    async def SearchExpenses(self, request, context):
+        """Search expenses by vendor name and document text, best matches first."""
+        try:
+            user_id = get_user_id_from_context(context)
+            if not user_id:
+                error_msg = 'User ID not found in token'
+                logger.error(f"SearchExpenses failed: {error_msg}")
+                context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                context.set_details(error_msg)
+                return expense_pb2.SearchExpensesResponse(success=False, error_message=error_msg)
+
+            rows, tags_by_expense, next_page_token = await self.expense_service.search_expense_rows(
+                user_id=user_id,
+                query=request.query,
+                page_size=request.page_size if request.page_size > 0 else 20,
+                page_token=request.page_token or None,
+                filters=dict(request.filters)
+            )
+
+            return expense_pb2.SearchExpensesResponse(
+                expenses=self._rows_to_protos(rows, tags_by_expense),
+                next_page_token=next_page_token or "",
+                success=True
+            )
+
+        except ValueError as e:
+            error_msg = f"SearchExpenses failed: {str(e)}"
+            logger.error(error_msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error_msg)
+            return expense_pb2.SearchExpensesResponse(success=False, error_message=error_msg)
+        except Exception as e:
+            error_msg = f"SearchExpenses failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.SearchExpensesResponse(success=False, error_message=error_msg)
+
+    async def SyncExpenses(self, request, context):
+        """Return the expenses changed and deleted since the client's watermark."""
+        try:
+            user_id = get_user_id_from_context(context)
+            if not user_id:
+                error_msg = 'User ID not found in token'
+                logger.error(f"SyncExpenses failed: {error_msg}")
+                context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                context.set_details(error_msg)
+                return expense_pb2.SyncExpensesResponse(success=False, error_message=error_msg)
+
+            page = await self.expense_service.sync_expense_rows(
+                user_id=user_id,
+                watermark=request.watermark or None,
+                page_size=request.page_size if request.page_size > 0 else 500
+            )
+
+            return expense_pb2.SyncExpensesResponse(
+                expenses=self._rows_to_protos(page.rows, page.tags),
+                deleted_expense_ids=page.deleted_ids,
+                watermark=page.watermark,
+                has_more=page.has_more,
+                full_resync_required=page.full_resync_required,
+                success=True
+            )
+
+        except ValueError as e:
+            error_msg = f"SyncExpenses failed: {str(e)}"
+            logger.error(error_msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error_msg)
+            return expense_pb2.SyncExpensesResponse(success=False, error_message=error_msg)
+        except Exception as e:
+            error_msg = f"SyncExpenses failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.SyncExpensesResponse(success=False, error_message=error_msg)
+
+    async def WatchExpenses(self, request, context):
+        """Push the user's expense changes until the client hangs up.
+
+        Changes arrive through the process-wide ExpenseChangeHub; each one is
+        sent with the changed expenses as currently stored. A watcher that
+        cannot keep up is evicted instead of buffering without bound.
+        """
+        user_id = get_user_id_from_context(context)
+        if not user_id:
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, 'User ID not found in token')
+
+        try:
+            fields = read_fields(request.read_mask.paths)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        subscription = expense_change_hub.subscribe(user_id)
+        try:
+            while True:
+                change = await subscription.get()
+                if change is None:
+                    await context.abort(
+                        grpc.StatusCode.UNAVAILABLE, f"{subscription.reason}; sync and watch again"
+                    )
+                rows, tags_by_expense = await self.expense_service.get_expense_rows(
+                    user_id, change.changed_ids, fields
+                )
+                yield expense_pb2.WatchExpensesResponse(
+                    expenses=self._rows_to_protos(rows, tags_by_expense, fields),
+                    deleted_expense_ids=change.deleted_ids
+                )
+        finally:
+            expense_change_hub.unsubscribe(subscription)
+
+    async def StreamExpenses(self, request, context):
+        """Stream a user's expenses in batches.
+
+        Each batch is yielded as soon as it is read; grpc.aio suspends the
+        generator while the client's flow-control window is full, so a slow
+        reader throttles the database cursor instead of buffering rows.
+        """
+        user_id = get_user_id_from_context(context)
+        if not user_id:
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, 'User ID not found in token')
+
+        batch_size = request.batch_size if request.batch_size > 0 else 500
+        try:
+            fields = read_fields(request.read_mask.paths)
+            async for rows, tags_by_expense in self.expense_service.stream_expense_rows(
+                user_id=user_id,
+                sort_by=request.sort_by if request.sort_by else 'expense_date',
+                ascending=request.ascending,
+                filters=dict(request.filters),
+                batch_size=min(batch_size, MAX_PAGE_SIZE),
+                fields=fields
+            ):
+                yield expense_pb2.StreamExpensesResponse(
+                    expenses=self._rows_to_protos(rows, tags_by_expense, fields)
+                )
+        except ValueError as e:
+            logger.error(f"StreamExpenses failed: {str(e)}")
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except Exception as e:
+            error_msg = f"StreamExpenses failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            await context.abort(grpc.StatusCode.INTERNAL, error_msg)
+
+    async def ExportExpenses(self, request, context):
+        """Stream a user's expenses as one CSV or Parquet file.
+
+        Like StreamExpenses, chunks are yielded as they are produced and a
+        slow reader throttles the export rather than buffering it.
+        """
+        user_id = get_user_id_from_context(context)
+        if not user_id:
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, 'User ID not found in token')
+
+        try:
+            async for chunk in export_expenses(
+                user_id=user_id,
+                export_format=request.format.lower() if request.format else 'csv',
+                columns=list(request.columns),
+                filters=dict(request.filters)
+            ):
+                yield expense_pb2.ExportExpensesResponse(data=chunk.data, row_count=chunk.row_count or 0)
+        except ValueError as e:
+            logger.error(f"ExportExpenses failed: {str(e)}")
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except ImportError as e:
+            logger.error(f"ExportExpenses failed: {str(e)}")
+            await context.abort(grpc.StatusCode.UNIMPLEMENTED, str(e))
+        except Exception as e:
+            error_msg = f"ExportExpenses failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            await context.abort(grpc.StatusCode.INTERNAL, error_msg)
+
+    async def GetSpendingSummary(self, request, context):
+        """Get spending totals grouped by a single dimension."""
+        try:
+            user_id = get_user_id_from_context(context)
+            if not user_id:
+                error_msg = 'User ID not found in token'
+                logger.error(f"GetSpendingSummary failed: {error_msg}")
+                context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                context.set_details(error_msg)
+                return expense_pb2.GetSpendingSummaryResponse(success=False, error_message=error_msg)
+
+            rows = await self.summary_service.get_spending_summary(
+                user_id=user_id,
+                group_by=request.group_by or 'category',
+                date_from=request.date_from.ToDatetime() if request.HasField('date_from') else None,
+                date_to=request.date_to.ToDatetime() if request.HasField('date_to') else None
+            )
+
+            groups = [
+                expense_pb2.SpendingSummaryGroup(
+                    key=row.key,
+                    label=row.label or "",
+                    currency=row.currency,
+                    total_amount=row.total_amount or 0.0,
+                    total_tax=row.total_tax or 0.0,
+                    count=row.expense_count,
+                    paid_amount=row.paid_amount or 0.0,
+                    unpaid_amount=row.unpaid_amount or 0.0,
+                    paid_count=row.paid_count or 0,
+                    unpaid_count=row.unpaid_count or 0
+                )
+                for row in rows
+            ]
+            return expense_pb2.GetSpendingSummaryResponse(groups=groups, success=True)
+
+        except ValueError as e:
+            error_msg = f"GetSpendingSummary failed: {str(e)}"
+            logger.error(error_msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error_msg)
+            return expense_pb2.GetSpendingSummaryResponse(success=False, error_message=error_msg)
+        except Exception as e:
+            error_msg = f"GetSpendingSummary failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.GetSpendingSummaryResponse(success=False, error_message=error_msg)
+
+    async def _bulk_update(self, name: str, request, context, mutate):
+        """Run one of the bulk update RPCs.
+
+        mutate(user_id, ids, filters) performs the change and returns the
+        affected expense ids; the updated expenses are loaded afterwards only
+        when the request asks for them.
+        """
+        try:
+            user_id = get_user_id_from_context(context)
+            if not user_id:
+                error_msg = 'User ID not found in token'
+                logger.error(f"{name} failed: {error_msg}")
+                context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+                context.set_details(error_msg)
+                return expense_pb2.BulkExpensesResponse(success=False, error_message=error_msg)
+
+            affected = await mutate(user_id, list(request.selection.ids), dict(request.selection.filters))
+            response = expense_pb2.BulkExpensesResponse(
+                affected_count=len(affected),
+                expense_ids=affected,
+                success=True
+            )
+            if getattr(request, 'return_expenses', False) and affected:
+                rows, tags_by_expense = await self.expense_service.get_expense_rows(user_id, affected)
+                response.expenses.extend(self._rows_to_protos(rows, tags_by_expense))
+            return response
+
+        except ValueError as e:
+            error_msg = f"{name} failed: {str(e)}"
+            logger.error(error_msg)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(error_msg)
+            return expense_pb2.BulkExpensesResponse(success=False, error_message=error_msg)
+        except Exception as e:
+            error_msg = f"{name} failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.BulkExpensesResponse(success=False, error_message=error_msg)
+
+    async def BulkMarkPaid(self, request, context):
+        """Mark the selected expenses paid or unpaid."""
+        paid_on = request.paid_on.ToDatetime() if request.HasField('paid_on') else None
+        return await self._bulk_update(
+            'BulkMarkPaid', request, context,
+            lambda user_id, ids, filters: self.expense_service.mark_expenses_paid(
+                user_id, ids, filters, request.is_paid, paid_on
+            )
+        )
+
+    async def BulkRecategorize(self, request, context):
+        """Move the selected expenses to another category."""
+        return await self._bulk_update(
+            'BulkRecategorize', request, context,
+            lambda user_id, ids, filters: self.expense_service.recategorize_expenses(
+                user_id, ids, filters, request.category_id
+            )
+        )
+
+    async def BulkRetag(self, request, context):
+        """Add and remove tags on the selected expenses."""
+        return await self._bulk_update(
+            'BulkRetag', request, context,
+            lambda user_id, ids, filters: self.expense_service.retag_expenses(
+                user_id, ids, filters, list(request.add_tag_ids), list(request.remove_tag_ids)
+            )
+        )
+
+    async def BulkDeleteExpenses(self, request, context):
+        """Delete the selected expenses."""
+        return await self._bulk_update(
+            'BulkDeleteExpenses', request, context,
+            self.expense_service.delete_expenses
+        )
+
     async def UpdateExpense(self, request, context):
         """Update an expense."""
         try:
@@ -233,17 +663,22 @@ class ExpenseServicer(expense_pb2_grpc.ExpenseServiceServicer):
             if request.HasField('due_date'):
                 update_data.due_date = request.due_date.ToDatetime()
 
+            if request.HasField('document_text'):
+                update_data.document_text = request.document_text
+
             # Update expense
-            expense = await self.expense_service.update_expense(user_id, request.id, update_data)
-            if not expense:
+            updated = await self.expense_service.update_expense(user_id, request.id, update_data)
+            if not updated:
                 error_msg = f"Expense {request.id} not found"
                 logger.error(f"UpdateExpense failed: {error_msg}")
                 return expense_pb2.ExpenseResponse(success=False, error_message=error_msg)
 
             # Convert to proto and return
-            expense_proto = self._expense_to_proto(expense)
+            row, tags = updated
+            expense_proto = self._rows_to_protos([row], {row.id: tags})[0]
             return expense_pb2.ExpenseResponse(
                 expense=expense_proto,
+                version=await expense_version_token(row.updated_at),
                 success=True
             )
 
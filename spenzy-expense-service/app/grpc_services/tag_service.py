@@ -9,6 +9,9 @@ from spenzy_common.utils.token_utils import get_user_id_from_context
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Most tags ListTags returns, whatever limit the request asks for
+MAX_LIST_TAGS = 1000
+
 class TagServicer(expense_pb2_grpc.TagServiceServicer):
     def __init__(self):
         self.tag_service = TagService()
@@ -34,7 +37,8 @@ class TagServicer(expense_pb2_grpc.TagServiceServicer):
         """List all tags for a user."""
         try:
             user_id = get_user_id_from_context(context)
-            tags = await self.tag_service.get_tags(user_id, request.query)
+            limit = min(request.limit, MAX_LIST_TAGS) if request.limit > 0 else MAX_LIST_TAGS
+            tags = await self.tag_service.get_tags(user_id, request.query, limit)
             
             return expense_pb2.ListTagsResponse(
                 tags=[self._tag_to_proto(tag) for tag in tags],
@@ -66,6 +70,24 @@ class TagServicer(expense_pb2_grpc.TagServiceServicer):
                 error_message=error_msg
             )
 
+    async def CreateTags(self, request, context):
+        """Create several tags at once, reusing those that already exist."""
+        try:
+            user_id = get_user_id_from_context(context)
+            tags = await self.tag_service.get_or_create_tags(user_id, list(request.names))
+
+            return expense_pb2.CreateTagsResponse(
+                tags=[self._tag_to_proto(tag) for tag in tags],
+                success=True
+            )
+        except Exception as e:
+            error_msg = f"CreateTags failed: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return expense_pb2.CreateTagsResponse(
+                success=False,
+                error_message=error_msg
+            )
+
     async def DeleteTag(self, request, context):
         """Delete a tag."""
         try:
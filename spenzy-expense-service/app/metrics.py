@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# In-process metrics: monotonically increasing counters, timings summarised
+# per reporting window and gauges read when a snapshot is taken
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+_timings: Dict[str, list] = {}
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def increment(name: str, value: int = 1) -> None:
+    """Add value to a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record one timing sample."""
+    with _lock:
+        timing = _timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+
+def register_gauge(name: str, read: Callable[[], float]) -> None:
+    """Register a callable that returns the current value of a gauge."""
+    _gauges[name] = read
+
+
+def snapshot(reset_timings: bool = False) -> Dict[str, float]:
+    """Return all metrics as a flat name -> value mapping.
+
+    Timings are reported as <name>.count, <name>.avg_ms and <name>.max_ms over
+    the samples seen since the last reset.
+    """
+    with _lock:
+        values: Dict[str, float] = dict(_counters)
+        for name, (count, total, longest) in _timings.items():
+            values[f'{name}.count'] = count
+            values[f'{name}.avg_ms'] = round(total / count * 1000, 3) if count else 0.0
+            values[f'{name}.max_ms'] = round(longest * 1000, 3)
+        if reset_timings:
+            _timings.clear()
+    for name, read in _gauges.items():
+        try:
+            values[name] = read()
+        except Exception:
+            logger.warning(f"Failed to read gauge {name}", exc_info=True)
+    return values
+
+
+async def report_metrics(interval: float) -> None:
+    """Log a metrics snapshot every interval seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        values = snapshot(reset_timings=True)
+        logger.info("metrics " + " ".join(f"{name}={value}" for name, value in sorted(values.items())))
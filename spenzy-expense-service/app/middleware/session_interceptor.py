@@ -0,0 +1,94 @@
+import logging
+from typing import Iterable, Optional
+import grpc
+from grpc import aio
+from spenzy_common.utils.token_utils import get_user_id_from_context
+from app.database import READ_AFTER_LSN_KEY, has_written, record_write, request_session, write_position
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SessionInterceptor(aio.ServerInterceptor):
+    """Give every unary RPC one database session and transaction.
+
+    Service calls made while handling the RPC reuse the session through
+    get_db(), so the RPC holds at most one pooled connection. The transaction
+    is committed once after the handler returns, and rolled back when the
+    handler raises, sets a non-OK status or answers with success=False.
+
+    Methods listed in read_only_methods may be served by the read replica.
+    Any other RPC that commits changes made through commit() returns the
+    primary's WAL position in the
+    READ_AFTER_LSN_KEY trailer; reads sending it back stay on the primary
+    until the replica has replayed that far, so callers see their own writes
+    whichever server process answers. Callers that do not send it are kept
+    on the primary for a while by the process they wrote through.
+
+    Streaming RPCs keep their per-call sessions: one transaction held open
+    for the length of a stream would pin a connection for all of it.
+    """
+
+    def __init__(self, read_only_methods: Iterable[str] = ()):
+        self.read_only_methods = frozenset(read_only_methods)
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+
+        behavior = handler.unary_unary
+        read_only = handler_call_details.method in self.read_only_methods
+
+        async def unit_of_work(request, context):
+            user_id = self._user_id(context)
+            read_after = dict(context.invocation_metadata()).get(READ_AFTER_LSN_KEY)
+            async with request_session(read_only=read_only, user_id=user_id, read_after=read_after) as session:
+                try:
+                    response = await behavior(request, context)
+                except BaseException:
+                    await session.rollback()
+                    raise
+
+                if self._succeeded(response, context):
+                    try:
+                        await session.commit()
+                    except Exception as e:
+                        logger.error(f"Error committing {handler_call_details.method}: {str(e)}", exc_info=True)
+                        await session.rollback()
+                        await context.abort(grpc.StatusCode.INTERNAL, "Failed to commit transaction")
+                    if not read_only and user_id and has_written(session):
+                        record_write(user_id)
+                        await self._send_write_position(session, context)
+                else:
+                    await session.rollback()
+                return response
+
+        return grpc.unary_unary_rpc_method_handler(
+            unit_of_work,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+    async def _send_write_position(self, session, context) -> None:
+        try:
+            position = await write_position(session)
+        except Exception as e:
+            # The write is committed; the caller only loses read-your-writes routing
+            logger.warning(f"Failed to read the WAL position: {str(e)}")
+            return
+        if position:
+            context.set_trailing_metadata(((READ_AFTER_LSN_KEY, position),))
+
+    def _succeeded(self, response, context) -> bool:
+        if context.code() not in (None, grpc.StatusCode.OK):
+            return False
+        return getattr(response, 'success', True) is not False
+
+    def _user_id(self, context) -> Optional[str]:
+        # Unauthenticated methods have no user; they are routed as anonymous
+        try:
+            return get_user_id_from_context(context)
+        except Exception:
+            return None
@@ -1,7 +1,10 @@
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 class Category(BaseModel):
+    # Shared by every reader of the category cache, so it must not change
+    model_config = ConfigDict(frozen=True)
+
     id: int
     name: str
     description: str | None = None
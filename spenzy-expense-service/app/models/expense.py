@@ -38,6 +38,7 @@ class ExpenseCreate(BaseModel):
     paid_on: Optional[datetime] = None
     due_date: Optional[datetime] = None
     tag_ids: List[int] = []
+    document_text: Optional[str] = None
 
 class ExpenseUpdate(BaseModel):
     expense_date: Optional[datetime] = None
@@ -49,4 +50,5 @@ class ExpenseUpdate(BaseModel):
     is_paid: Optional[bool] = None
     paid_on: Optional[datetime] = None
     due_date: Optional[datetime] = None
-    tag_ids: Optional[List[int]] = None 
\ No newline at end of file
+    tag_ids: Optional[List[int]] = None
+    document_text: Optional[str] = None 
\ No newline at end of file
@@ -0,0 +1,196 @@
+import logging
+import os
+from datetime import date, datetime
+from typing import List, Optional
+from sqlalchemy import text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The expenses table is range partitioned by expense_date into one partition
+# per calendar month, named expenses_pYYYY_MM. Rows outside every monthly
+# partition (typically back-dated expenses from before the first one) land in
+# the default partition.
+PARENT = 'expenses'
+DEFAULT_PARTITION = 'expenses_default'
+UNPARTITIONED = 'expenses_unpartitioned'
+
+# Months of partitions kept created ahead of the current one
+PARTITION_MONTHS_AHEAD = int(os.getenv('EXPENSE_PARTITION_MONTHS_AHEAD', '3'))
+
+# Advisory lock serialising partition DDL between replicas
+_LOCK_KEY = 0x65787061  # 'expa'
+
+
+def month_start(value) -> date:
+    """First day of the month containing value (a date or datetime)."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month months after month."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{PARENT}_p{month:%Y_%m}'
+
+
+async def is_partitioned(connection) -> bool:
+    """Whether the expenses table exists as a partitioned table."""
+    relkind = await connection.scalar(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"
+    ), {'name': PARENT})
+    return relkind == 'p'
+
+
+async def _lock(connection) -> None:
+    await connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': _LOCK_KEY})
+
+
+async def _partitions(connection) -> List[str]:
+    result = await connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:name)"
+    ), {'name': PARENT})
+    return list(result.scalars())
+
+
+async def _copy_columns(connection) -> str:
+    """Comma separated columns of expenses that can be inserted, i.e. not generated ones."""
+    result = await connection.execute(text(
+        "SELECT quote_ident(attname) FROM pg_attribute "
+        "WHERE attrelid = to_regclass(:name) AND attnum > 0 AND NOT attisdropped AND attgenerated = '' "
+        "ORDER BY attnum"
+    ), {'name': PARENT})
+    return ', '.join(result.scalars())
+
+
+async def _create_partition(connection, month: date) -> None:
+    """Create the partition for one month, moving its rows out of the default partition.
+
+    Postgres refuses to add a partition while the default partition holds rows
+    in its range, so those are detached, moved through the parent and the
+    default partition is attached again, all in the caller's transaction.
+    """
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    in_range = "expense_date >= :start AND expense_date < :end"
+    params = {'start': month, 'end': add_months(month, 1)}
+
+    stranded = await connection.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"
+    ), params)
+    if not stranded:
+        await connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}"))
+        return
+
+    columns = await _copy_columns(connection)
+    await connection.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}"))
+    await connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}"))
+    moved = await connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING {columns}) "
+        f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+    ), params)
+    await connection.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.info(f"Moved {moved.rowcount} expenses from {DEFAULT_PARTITION} to {name}")
+
+
+async def _stranded_months(connection) -> List[date]:
+    """Months of the rows in the default partition, which each deserve a partition."""
+    result = await connection.execute(text(
+        f"SELECT DISTINCT date_trunc('month', expense_date)::date FROM {DEFAULT_PARTITION}"
+    ))
+    return list(result.scalars())
+
+
+async def ensure_partitions(
+    connection,
+    first_month: Optional[date] = None,
+    months_ahead: int = PARTITION_MONTHS_AHEAD
+) -> List[str]:
+    """Create the missing monthly partitions of expenses; returns their names.
+
+    Covers first_month (default: the current month) through months_ahead
+    months after the current one, every earlier month with rows stranded in
+    the default partition, and the default partition itself. Does nothing
+    while expenses is still a plain table, see partition_expenses. Runs in
+    the caller's transaction.
+    """
+    if not await is_partitioned(connection):
+        return []
+    await _lock(connection)
+
+    existing = set(await _partitions(connection))
+    created = []
+    if DEFAULT_PARTITION not in existing:
+        await connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+        created.append(DEFAULT_PARTITION)
+
+    current = month_start(datetime.utcnow())
+    month = min(first_month or current, current)
+    last = add_months(current, months_ahead)
+    months = set()
+    while month <= last:
+        months.add(month)
+        month = add_months(month, 1)
+    # Back-dated expenses of months without a partition sit in the default one
+    months.update(await _stranded_months(connection))
+
+    for month in sorted(months):
+        if partition_name(month) not in existing:
+            await _create_partition(connection, month)
+            created.append(partition_name(month))
+
+    if created:
+        logger.info(f"Created expense partitions: {', '.join(created)}")
+    return created
+
+
+async def partition_expenses(connection, table) -> int:
+    """Rebuild a plain expenses table as the partitioned table; returns the rows moved.
+
+    table is the SQLAlchemy Table of expenses, used to create the new parent
+    with its indexes. The old table is renamed and stripped of its indexes
+    (their names are reused), the new parent gets monthly partitions covering
+    every existing expense_date, the rows are copied over with their ids and
+    the id sequence continues after the highest one. The expense_tags foreign
+    key is dropped since it cannot reference a partitioned table by id alone.
+
+    Everything happens in the caller's transaction and holds an exclusive
+    lock on expenses until it commits, so run it in a maintenance window.
+    """
+    relkind = await connection.scalar(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"
+    ), {'name': PARENT})
+    if relkind != 'r':
+        return 0
+    await _lock(connection)
+
+    await connection.execute(text("ALTER TABLE expense_tags DROP CONSTRAINT IF EXISTS expense_tags_expense_id_fkey"))
+    await connection.execute(text(f"ALTER TABLE {PARENT} RENAME TO {UNPARTITIONED}"))
+    await connection.execute(text(f"ALTER SEQUENCE IF EXISTS {PARENT}_id_seq RENAME TO {UNPARTITIONED}_id_seq"))
+    await connection.execute(text(f"ALTER TABLE {UNPARTITIONED} DROP CONSTRAINT IF EXISTS {PARENT}_pkey"))
+    indexes = await connection.execute(text(
+        "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(:name)"
+    ), {'name': UNPARTITIONED})
+    for index in indexes.scalars().all():
+        await connection.execute(text(f"DROP INDEX {index}"))
+
+    await connection.run_sync(table.create)
+    oldest = await connection.scalar(text(f"SELECT min(expense_date) FROM {UNPARTITIONED}"))
+    await ensure_partitions(connection, month_start(oldest) if oldest else None)
+
+    columns = await _copy_columns(connection)
+    copied = await connection.execute(text(
+        f"INSERT INTO {PARENT} ({columns}) SELECT {columns} FROM {UNPARTITIONED}"
+    ))
+    await connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'), max(id)) FROM {PARENT} HAVING max(id) IS NOT NULL"
+    ))
+    await connection.execute(text(f"DROP TABLE {UNPARTITIONED}"))
+    await connection.execute(text(f"ANALYZE {PARENT}"))
+    logger.info(f"Moved {copied.rowcount} expenses into the partitioned table")
+    return copied.rowcount
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app import metrics
+from app.database import DB_REPLICA_MAX_LAG_SECONDS, Category, get_db, is_replica_session, listen
+from app.models.category import Category as CategoryModel
+
+# Postgres channel notified whenever the categories table changes
+CHANNEL = 'category_changes'
+
+
+class _Snapshot(NamedTuple):
+    categories: List[CategoryModel]
+    by_id: Dict[int, CategoryModel]
+    by_name: Dict[str, CategoryModel]
+    version: str
+
+
+class CategoryCache:
+    """In-process copy of the categories table, indexed by id and by name.
+
+    The table is loaded whole on first use and after every invalidation,
+    through the request's session when there is one, so a miss takes no
+    extra connection. Writers invalidate it locally when their transaction
+    commits and notify the other replicas through CHANNEL; listen() applies
+    those notifications.
+    Cached categories are frozen pydantic models, never ORM instances, so
+    they can be shared between sessions and callers.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[_Snapshot] = None
+        self._generation = 0
+        self._invalidated_at = float('-inf')
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """Drop the cached table; the next read reloads it."""
+        self._generation += 1
+        self._invalidated_at = time.monotonic()
+        self._snapshot = None
+
+    def _may_keep(self, session) -> bool:
+        """Whether rows read through session may be cached for everyone.
+
+        Not when the session's transaction changed categories itself, as its
+        rows are not committed yet, nor when it reads from the replica
+        shortly after an invalidation, which it may not have replayed yet.
+        """
+        if session.info.get('categories_changed', False):
+            return False
+        if is_replica_session(session):
+            # Reads only go to the replica while its lag is below the maximum
+            return time.monotonic() - self._invalidated_at > DB_REPLICA_MAX_LAG_SECONDS + 1
+        return True
+
+    async def _get_snapshot(self) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            metrics.increment('category_cache.hits')
+            return snapshot
+
+        metrics.increment('category_cache.misses')
+        async with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            generation = self._generation
+            async for session in get_db():
+                result = await session.execute(select(Category).order_by(Category.name))
+                categories = [
+                    CategoryModel.model_validate(category, from_attributes=True)
+                    for category in result.scalars()
+                ]
+                keep = self._may_keep(session)
+            # Changes when a category is added, updated or removed
+            latest = max((category.updated_at for category in categories), default=None)
+            snapshot = _Snapshot(
+                categories,
+                {category.id: category for category in categories},
+                {category.name: category for category in categories},
+                f"{len(categories)}.{int(latest.timestamp() * 1_000_000) if latest else 0}",
+            )
+            # An invalidation during the load means the rows may be stale
+            if keep and generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+
+    async def get_all(self) -> List[CategoryModel]:
+        """All categories ordered by name."""
+        return list((await self._get_snapshot()).categories)
+
+    async def get(self, category_id: int) -> Optional[CategoryModel]:
+        return (await self._get_snapshot()).by_id.get(category_id)
+
+    async def get_by_name(self, name: str) -> Optional[CategoryModel]:
+        return (await self._get_snapshot()).by_name.get(name)
+
+    async def version(self) -> str:
+        """Short string that changes whenever the categories table does."""
+        return (await self._get_snapshot()).version
+
+    async def listen(self, reconnect_delay: float = 5.0) -> None:
+        """Invalidate on notifications from other replicas until cancelled.
+
+        The cache is also invalidated on every (re)connect, since
+        notifications sent while disconnected are lost.
+        """
+        await listen(CHANNEL, self._on_notify, self.invalidate, reconnect_delay)
+
+    def _on_notify(self, payload: str) -> None:
+        metrics.increment('category_cache.notifications')
+        self.invalidate()
+
+
+category_cache = CategoryCache()
+
+
+async def notify_categories_changed(session) -> None:
+    """Mark the caller's transaction as changing categories.
+
+    The local cache is invalidated when the transaction commits, and the
+    NOTIFY, being transactional, reaches the other replicas at the same time.
+    """
+    session.info['categories_changed'] = True
+    await session.execute(select(func.pg_notify(CHANNEL, '')))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('categories_changed', False):
+        category_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('categories_changed', None)
@@ -1,23 +1,30 @@
+import os
 from typing import List, Optional
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
-from ..database import get_db, Category
-from ..models.category import CategoryCreate, CategoryUpdate
+from sqlalchemy import delete, exists, func, select, update
+from ..database import commit, get_db, Category, Expense
+from ..models.category import Category as CategoryModel, CategoryCreate, CategoryUpdate
+from .category_cache import category_cache, notify_categories_changed
+from .expense_counters import merge_category_counters
+from .expense_events import expense_change_notice
+from .expense_rollups import merge_category_rollups
+
+# Users allowed to merge categories, comma-separated. Categories are shared
+# by every user, so a merge rewrites other users' expenses.
+CATEGORY_ADMIN_USERS = frozenset(
+    user_id.strip() for user_id in os.getenv('CATEGORY_ADMIN_USERS', '').split(',') if user_id.strip()
+)
+
+# updated_by recorded on expenses changed by maintenance rather than by their owner
+SYSTEM_ACTOR = 'system'
 
 class CategoryService:
-    async def get_categories(self) -> List[Category]:
-        """Get all categories."""
-        async for session in get_db():
-            stmt = select(Category).order_by(Category.name)
-            result = await session.execute(stmt)
-            return list(result.scalars().all())
+    async def get_categories(self) -> List[CategoryModel]:
+        """Get all categories, from the in-process cache."""
+        return await category_cache.get_all()
 
-    async def get_category(self, category_id: int) -> Optional[Category]:
-        """Get a category by ID."""
-        async for session in get_db():
-            stmt = select(Category).filter(Category.id == category_id)
-            result = await session.execute(stmt)
-            return result.scalar_one_or_none()
+    async def get_category(self, category_id: int) -> Optional[CategoryModel]:
+        """Get a category by ID, from the in-process cache."""
+        return await category_cache.get(category_id)
 
     async def create_category(self, category: CategoryCreate) -> Category:
         """Create a new category."""
@@ -30,7 +37,8 @@ class CategoryService:
         
         async for session in get_db():
             session.add(db_category)
-            await session.commit()
+            await notify_categories_changed(session)
+            await commit(session)
             await session.refresh(db_category)
             return db_category
 
@@ -50,33 +58,80 @@ class CategoryService:
             for field, value in update_data.items():
                 setattr(db_category, field, value)
 
-            await session.commit()
+            await notify_categories_changed(session)
+            await commit(session)
             await session.refresh(db_category)
             return db_category
 
+    async def _is_in_use(self, session, category_id: int) -> bool:
+        """Whether any expense references the category, as one EXISTS probe on ix_expenses_category_id."""
+        stmt = select(exists().where(Expense.category_id == category_id))
+        return (await session.execute(stmt)).scalar()
+
+    async def _lock_category(self, session, category_id: int, shared: bool = False) -> bool:
+        """Lock a category row for the rest of the transaction; False if it is missing.
+
+        An exclusive lock also holds back new expenses referencing the
+        category until the transaction ends.
+        """
+        stmt = select(Category.id).filter(Category.id == category_id).with_for_update(read=shared)
+        return (await session.execute(stmt)).scalar_one_or_none() is not None
+
     async def delete_category(self, category_id: int) -> bool:
         """Delete a category if it's not being used by any expenses."""
         async for session in get_db():
-            # First check if category is being used
-            stmt = select(Category).filter(Category.id == category_id)
-            result = await session.execute(stmt)
-            db_category = result.scalar_one_or_none()
-            
-            if not db_category:
+            if not await self._lock_category(session, category_id):
                 return False
 
             # Check if category has any expenses
-            if db_category.expenses:
+            if await self._is_in_use(session, category_id):
                 return False
 
             # If not in use, delete it
-            await session.delete(db_category)
-            await session.commit()
+            await session.execute(delete(Category).filter(Category.id == category_id))
+            await notify_categories_changed(session)
+            await commit(session)
             return True
 
-    async def get_category_by_name(self, name: str) -> Optional[Category]:
-        """Get a category by name."""
+    async def merge_categories(self, source_id: int, target_id: int, user_id: str) -> Optional[int]:
+        """Move every expense of the source category to the target and delete the source.
+
+        Only CATEGORY_ADMIN_USERS may merge; PermissionError otherwise. The
+        expenses of every user move with one UPDATE, recorded as changed by
+        SYSTEM_ACTOR, which also notifies each owner's watchers. The
+        per-category counters and daily rollups are folded into the target's.
+        Returns the number of expenses moved, or None if either category does
+        not exist.
+        """
+        if user_id not in CATEGORY_ADMIN_USERS:
+            raise PermissionError("Only category administrators can merge categories")
+        if source_id == target_id:
+            raise ValueError("Cannot merge a category into itself")
+
         async for session in get_db():
-            stmt = select(Category).filter(Category.name == name)
-            result = await session.execute(stmt)
-            return result.scalar_one_or_none() 
\ No newline at end of file
+            # Lock in id order so two opposite merges cannot deadlock
+            for category_id in sorted((source_id, target_id)):
+                if not await self._lock_category(session, category_id, shared=category_id == target_id):
+                    return None
+
+            moved = update(Expense).filter(
+                Expense.category_id == source_id
+            ).values(
+                category_id=target_id,
+                updated_by=SYSTEM_ACTOR
+            ).returning(Expense.user_id, Expense.id).cte('moved_expenses')
+            stmt = select(func.count()).select_from(moved).add_cte(
+                expense_change_notice(select(moved.c.user_id, moved.c.id))
+            )
+            moved_count = (await session.execute(stmt)).scalar_one()
+
+            await merge_category_counters(session, source_id, target_id)
+            await merge_category_rollups(session, source_id, target_id)
+            await session.execute(delete(Category).filter(Category.id == source_id))
+            await notify_categories_changed(session)
+            await commit(session)
+            return moved_count
+
+    async def get_category_by_name(self, name: str) -> Optional[CategoryModel]:
+        """Get a category by name, from the in-process cache."""
+        return await category_cache.get_by_name(name) 
\ No newline at end of file
@@ -0,0 +1,147 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, literal, select, text, true
+from sqlalchemy.dialects.postgresql import insert
+from app.database import Expense, ExpenseCounter
+from app.services.expense_filters import parse_bool, parse_int
+
+CounterKey = Tuple[str, str]
+
+
+def counter_keys(is_paid: bool, category_id: int) -> List[CounterKey]:
+    """Counter rows an expense with the given attributes contributes to."""
+    return [
+        ('all', ''),
+        ('is_paid', 'true' if is_paid else 'false'),
+        ('category_id', str(category_id)),
+    ]
+
+
+def counter_deltas(old: Optional[Tuple[bool, int]],
+                   new: Optional[Tuple[bool, int]]) -> Dict[CounterKey, int]:
+    """Counter changes for an expense moving from old to new (is_paid, category_id).
+
+    Pass None as old for a created expense and None as new for a deleted one.
+    """
+    deltas = Counter()
+    if old is not None:
+        deltas.subtract(counter_keys(*old))
+    if new is not None:
+        deltas.update(counter_keys(*new))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def counter_upsert(user_id: str, deltas: Dict[CounterKey, int]):
+    """Build the upsert adding counter deltas, or None when there is nothing to add.
+
+    Rows are sorted so concurrent writers lock counters in the same order.
+    """
+    if not deltas:
+        return None
+
+    stmt = insert(ExpenseCounter).values([
+        {'user_id': user_id, 'dimension': dimension, 'key': key, 'count': delta}
+        for (dimension, key), delta in sorted(deltas.items())
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[ExpenseCounter.user_id, ExpenseCounter.dimension, ExpenseCounter.key],
+        set_={'count': ExpenseCounter.count + stmt.excluded.count}
+    )
+
+
+async def apply_counter_deltas(session, user_id: str, deltas: Dict[CounterKey, int]) -> None:
+    """Upsert counter deltas within the caller's transaction."""
+    stmt = counter_upsert(user_id, deltas)
+    if stmt is not None:
+        await session.execute(stmt)
+
+
+async def merge_category_counters(session, source_id: int, target_id: int) -> None:
+    """Fold every user's counter for one category into another's.
+
+    Used when all expenses of the source category move to the target; the
+    caller commits.
+    """
+    source = select(
+        ExpenseCounter.user_id,
+        ExpenseCounter.dimension,
+        literal(str(target_id)),
+        ExpenseCounter.count
+    ).filter(
+        ExpenseCounter.dimension == 'category_id',
+        ExpenseCounter.key == str(source_id)
+    )
+    stmt = insert(ExpenseCounter).from_select(['user_id', 'dimension', 'key', 'count'], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExpenseCounter.user_id, ExpenseCounter.dimension, ExpenseCounter.key],
+        set_={'count': ExpenseCounter.count + stmt.excluded.count}
+    )
+    await session.execute(stmt)
+    await session.execute(delete(ExpenseCounter).filter(
+        ExpenseCounter.dimension == 'category_id',
+        ExpenseCounter.key == str(source_id)
+    ))
+
+
+def counter_key_for_filters(filters: Optional[Dict[str, str]]) -> Optional[CounterKey]:
+    """Return the counter row answering a filter set, or None if none does."""
+    if not filters:
+        return ('all', '')
+    if len(filters) != 1:
+        return None
+
+    (name, value), = filters.items()
+    if name == 'is_paid':
+        return ('is_paid', 'true' if parse_bool(name, value) else 'false')
+    if name == 'category_id':
+        return ('category_id', str(parse_int(name, value)))
+    return None
+
+
+async def get_counter(session, user_id: str, key: CounterKey) -> int:
+    """Read a single maintained counter, treating a missing row as zero."""
+    dimension, value = key
+    stmt = select(ExpenseCounter.count).filter(
+        ExpenseCounter.user_id == user_id,
+        ExpenseCounter.dimension == dimension,
+        ExpenseCounter.key == value
+    )
+    return (await session.execute(stmt)).scalar_one_or_none() or 0
+
+
+async def rebuild_counters(session, user_id: Optional[str] = None) -> int:
+    """Recompute counters from the expenses table, for all users or one user.
+
+    Returns the number of counter rows written. The caller commits. The
+    counters table is locked for the duration so concurrent writes wait and
+    apply their deltas on top of the rebuilt values.
+    """
+    await session.execute(text('LOCK TABLE expense_counters IN EXCLUSIVE MODE'))
+
+    user_filter = Expense.user_id == user_id if user_id else true()
+    clear = delete(ExpenseCounter)
+    if user_id:
+        clear = clear.filter(ExpenseCounter.user_id == user_id)
+    await session.execute(clear)
+
+    stmt = select(
+        Expense.user_id,
+        func.coalesce(Expense.is_paid, False),
+        Expense.category_id,
+        func.count()
+    ).filter(user_filter).group_by(
+        Expense.user_id, func.coalesce(Expense.is_paid, False), Expense.category_id
+    )
+    result = await session.execute(stmt)
+
+    totals: Dict[str, Counter] = {}
+    for row_user_id, is_paid, category_id, count in result:
+        user_totals = totals.setdefault(row_user_id, Counter())
+        for key in counter_keys(is_paid, category_id):
+            user_totals[key] += count
+
+    written = 0
+    for row_user_id, user_totals in totals.items():
+        await apply_counter_deltas(session, row_user_id, dict(user_totals))
+        written += len(user_totals)
+    return written
@@ -0,0 +1,42 @@
+from sqlalchemy import and_, delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from app.database import Expense, ExpenseDate
+
+
+def expense_date_upsert(rows):
+    """Upsert recording the dates of a SELECT of (expense id, expense_date) pairs.
+
+    Meant to run as a data-modifying CTE next to the write that created the
+    expenses or changed their dates.
+    """
+    stmt = insert(ExpenseDate).from_select(['expense_id', 'expense_date'], rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[ExpenseDate.expense_id],
+        set_={'expense_date': stmt.excluded.expense_date}
+    )
+
+
+def expense_date_delete(expense_ids):
+    """DELETE of the dates of a selectable of deleted expense ids."""
+    return delete(ExpenseDate).where(ExpenseDate.expense_id.in_(expense_ids))
+
+
+def expense_with_id(expense_id: int):
+    """Predicate selecting one expense by id within the partition holding it.
+
+    The date comes from a scalar subquery, which Postgres evaluates before
+    scanning expenses and prunes the other partitions with.
+    """
+    date = select(ExpenseDate.expense_date).filter(ExpenseDate.expense_id == expense_id)
+    return and_(Expense.id == expense_id, Expense.expense_date == date.scalar_subquery())
+
+
+def expenses_with_ids(ids):
+    """Predicate selecting expenses by a list or selectable of ids.
+
+    Matching (id, expense_date) against expense_dates lets Postgres join
+    into just the partitions holding the ids rather than probe them all.
+    """
+    return tuple_(Expense.id, Expense.expense_date).in_(
+        select(ExpenseDate.expense_id, ExpenseDate.expense_date).filter(ExpenseDate.expense_id.in_(ids))
+    )
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, NamedTuple, Optional, Set
+from sqlalchemy import Text, cast, func, select
+from app import metrics
+from app.database import listen
+from app.services.expense_versions import collection_version_bump
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Postgres channel notified whenever a user's expenses change
+CHANNEL = 'expense_changes'
+
+# Changes buffered per WatchExpenses stream before it is evicted as too slow
+WATCH_QUEUE_SIZE = int(os.getenv('EXPENSE_WATCH_QUEUE_SIZE', '100'))
+
+# Expense ids per notification, keeping payloads well under Postgres' 8000 bytes
+_IDS_PER_NOTIFICATION = 500
+
+
+class ExpenseChange(NamedTuple):
+    changed_ids: List[int]
+    deleted_ids: List[int]
+
+
+class Subscription:
+    """One watcher's queue of changes to a user's expenses.
+
+    get() returns None once the subscription has been evicted; reason then
+    says why, and the watcher has to resync before watching again.
+    """
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.reason: Optional[str] = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def get(self) -> Optional[ExpenseChange]:
+        if self.reason is not None:
+            return None
+        return await self._queue.get()
+
+    def _put(self, change: ExpenseChange) -> bool:
+        try:
+            self._queue.put_nowait(change)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _evict(self, reason: str) -> None:
+        self.reason = reason
+        # Drop what is buffered and wake a waiting get() with the end marker
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+
+class ExpenseChangeHub:
+    """Fans expense change notifications out to the subscribed watchers.
+
+    One LISTEN connection per process receives every user's changes and
+    hands each to that user's subscriptions without blocking. A subscription
+    whose queue is full is evicted rather than buffered without bound, and all
+    are evicted when the listener reconnects, as changes may have been missed.
+    """
+
+    def __init__(self, queue_size: int = WATCH_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        metrics.register_gauge(
+            'expense_watch.subscribers', lambda: sum(len(subs) for subs in self._subscriptions.values())
+        )
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self._queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id: str, change: ExpenseChange) -> None:
+        for subscription in list(self._subscriptions.get(user_id, ())):
+            if not subscription._put(change):
+                metrics.increment('expense_watch.evictions')
+                self._evict(subscription, "Watcher fell behind")
+
+    def _evict(self, subscription: Subscription, reason: str) -> None:
+        subscription._evict(reason)
+        self.unsubscribe(subscription)
+
+    def _evict_all(self) -> None:
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                self._evict(subscription, "Change notifications were interrupted")
+
+    async def listen(self, reconnect_delay: float = 5.0) -> None:
+        """Publish notifications from every replica's writes until cancelled."""
+        await listen(CHANNEL, self._on_notify, self._evict_all, reconnect_delay)
+
+    def _on_notify(self, payload: str) -> None:
+        metrics.increment('expense_watch.notifications')
+        try:
+            message = json.loads(payload)
+            self.publish(message['u'], ExpenseChange(message.get('c', []), message.get('d', [])))
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed expense change notification: {payload[:100]}")
+
+
+expense_change_hub = ExpenseChangeHub()
+
+
+def expense_change_notice(changes, deleted: bool = False):
+    """Data-modifying CTE notifying watchers of a write to expenses.
+
+    changes selects (user_id, expense id) pairs of the created, updated or,
+    with deleted, deleted expenses, normally from the RETURNING rows of the
+    write the CTE is attached to. Data-modifying CTEs always run, so the
+    NOTIFYs, split per user and per _IDS_PER_NOTIFICATION ids, and the bump
+    of each user's collection version travel in the write's own statement.
+    NOTIFY is transactional: watchers hear of the change once it commits,
+    and never if it rolls back. Nothing happens when changes is empty.
+    """
+    changed = changes.subquery('changed')
+    user_id, expense_id = changed.c
+    numbered = select(
+        user_id.label('user_id'),
+        expense_id.label('id'),
+        ((func.row_number().over(partition_by=user_id, order_by=expense_id) - 1)
+         // _IDS_PER_NOTIFICATION).label('chunk')
+    ).subquery('numbered')
+    payload = func.json_build_object('u', numbered.c.user_id, 'd' if deleted else 'c', func.json_agg(numbered.c.id))
+    # pg_notify is volatile, so Postgres evaluates it although nothing reads
+    # the column
+    notices = select(
+        numbered.c.user_id, func.pg_notify(CHANNEL, cast(payload, Text)).label('sent')
+    ).group_by(numbered.c.user_id, numbered.c.chunk).subquery('notices')
+    user_ids = select(notices.c.user_id).group_by(notices.c.user_id).order_by(notices.c.user_id)
+    return collection_version_bump(user_ids).cte('expense_change_notice')
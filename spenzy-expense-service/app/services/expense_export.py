@@ -0,0 +1,256 @@
+import asyncio
+import io
+import os
+from typing import AsyncIterator, Collection, Dict, List, NamedTuple, Optional
+from sqlalchemy import Text, cast, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from app import metrics
+from app.database import Category, Expense, Tag, expense_tags, get_db
+from app.services.expense_filters import apply_filters
+
+# Upper bound on the bytes carried by one exported chunk, below gRPC's
+# default 4 MiB receive limit
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPENSE_EXPORT_CHUNK_BYTES', str(256 * 1024)))
+
+# Rows fetched per cursor batch, and per row group, of a Parquet export
+EXPORT_BATCH_ROWS = int(os.getenv('EXPENSE_EXPORT_BATCH_ROWS', '50000'))
+
+# COPY output chunks buffered ahead of a slow reader
+_COPY_QUEUE_CHUNKS = 16
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+# Exportable columns, in default output order, with their Parquet types.
+# category is the category name and tags the expense's tag names.
+EXPORT_COLUMNS = {
+    'id': 'int64',
+    'expense_date': 'timestamp',
+    'vendor_name': 'string',
+    'total_amount': 'float64',
+    'total_tax': 'float64',
+    'currency': 'string',
+    'category_id': 'int64',
+    'category': 'string',
+    'tags': 'list',
+    'is_paid': 'bool',
+    'paid_on': 'timestamp',
+    'due_date': 'timestamp',
+    'user_id': 'string',
+    'created_at': 'timestamptz',
+    'created_by': 'string',
+    'updated_at': 'timestamptz',
+    'updated_by': 'string',
+}
+
+# Columns exported when none are requested
+DEFAULT_EXPORT_COLUMNS = tuple(
+    column for column in EXPORT_COLUMNS if column not in ('user_id', 'created_by', 'updated_by')
+)
+
+
+class ExportChunk(NamedTuple):
+    data: bytes
+    row_count: Optional[int]  # Rows exported in total; only set on the last chunk
+
+
+def export_columns(names: Collection[str]) -> List[str]:
+    """Resolve requested column names, keeping their order; none means all defaults.
+
+    Raises ValueError for unknown columns.
+    """
+    if not names:
+        return list(DEFAULT_EXPORT_COLUMNS)
+    unknown = sorted(set(names) - set(EXPORT_COLUMNS))
+    if unknown:
+        raise ValueError(f"Unsupported export columns: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def _column(name: str, export_format: str):
+    if name == 'category':
+        return Category.name.label('category')
+    if name == 'tags':
+        if export_format == 'csv':
+            names = func.string_agg(Tag.name, aggregate_order_by(literal_column("';'"), Tag.name))
+        else:
+            names = func.array_agg(aggregate_order_by(Tag.name, Tag.name))
+        return select(names).select_from(Tag).join(
+            expense_tags, expense_tags.c.tag_id == Tag.id
+        ).where(expense_tags.c.expense_id == Expense.id).scalar_subquery().label('tags')
+    if name == 'is_paid' and export_format == 'csv':
+        # true/false rather than COPY's t/f
+        return cast(Expense.is_paid, Text).label('is_paid')
+    return getattr(Expense, name)
+
+
+def export_statement(user_id: str, columns: List[str], filters: Optional[Dict[str, str]], export_format: str):
+    """SELECT of a user's filtered expenses with the export columns, oldest first.
+
+    Ordered by the (user_id, expense_date, id) index, so no sort is needed.
+    """
+    stmt = select(*[_column(column, export_format) for column in columns]).select_from(Expense)
+    if 'category' in columns:
+        stmt = stmt.join(Category, Category.id == Expense.category_id)
+    stmt = apply_filters(stmt.filter(Expense.user_id == user_id), filters)
+    return stmt.order_by(Expense.expense_date, Expense.id)
+
+
+def _pyarrow():
+    """Import pyarrow, which only Parquet exports need."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs the pyarrow package")
+    return pyarrow
+
+
+def _slices(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def _csv_chunks(session, stmt, chunk_bytes: int) -> AsyncIterator[ExportChunk]:
+    """Stream a CSV file with a header row straight from COPY ... TO STDOUT.
+
+    Postgres formats the rows itself; the bytes pass through a small bounded
+    queue, so a slow reader pauses the COPY instead of buffering the file.
+    """
+    connection = await session.connection()
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = [compiled.params[name] for name in compiled.positiontup]
+    driver = (await connection.get_raw_connection()).driver_connection
+
+    queue = asyncio.Queue(maxsize=_COPY_QUEUE_CHUNKS)
+
+    async def copy():
+        try:
+            status = await driver.copy_from_query(
+                str(compiled), *params, output=queue.put, format='csv', header=True
+            )
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(int(status.split()[-1]))
+
+    task = asyncio.create_task(copy())
+    try:
+        buffer = bytearray()
+        while True:
+            item = await queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, int):
+                yield ExportChunk(bytes(buffer), item)
+                return
+            buffer += item
+            if len(buffer) >= chunk_bytes:
+                yield ExportChunk(bytes(buffer), None)
+                buffer.clear()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what ParquetWriter writes until taken.
+
+    Keeps counting the position across takes, since the Parquet footer
+    records absolute offsets.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _parquet_chunks(session, stmt, columns: List[str], chunk_bytes: int) -> AsyncIterator[ExportChunk]:
+    """Stream a Parquet file written one row group per cursor batch."""
+    pa = _pyarrow()
+    types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us'),
+        'timestamptz': pa.timestamp('us', tz='UTC'),
+        'list': pa.list_(pa.string()),
+    }
+    schema = pa.schema([(column, types[EXPORT_COLUMNS[column]]) for column in columns])
+    sink = _ChunkSink()
+    writer = pa.parquet.ParquetWriter(sink, schema)
+
+    def write_batch(rows):
+        # Runs in a thread: building the arrays and encoding a row group is CPU bound
+        values = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema
+        ))
+
+    row_count = 0
+    try:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        async for partition in result.partitions():
+            await asyncio.to_thread(write_batch, partition)
+            row_count += len(partition)
+            for data in _slices(sink.take(), chunk_bytes):
+                yield ExportChunk(data, None)
+    finally:
+        writer.close()
+
+    # The footer goes out last, with the row count
+    tail = list(_slices(sink.take(), chunk_bytes)) or [b'']
+    for data in tail[:-1]:
+        yield ExportChunk(data, None)
+    yield ExportChunk(tail[-1], row_count)
+
+
+async def export_expenses(
+    user_id: str,
+    export_format: str = 'csv',
+    columns: Collection[str] = (),
+    filters: Optional[Dict[str, str]] = None,
+    chunk_bytes: int = EXPORT_CHUNK_BYTES
+) -> AsyncIterator[ExportChunk]:
+    """Stream one CSV or Parquet file of a user's filtered expenses, in chunks.
+
+    Rows come from a single query over expenses, their category and their
+    tags, read through a server-side cursor, so memory stays bounded by the
+    chunk and batch sizes however many rows are exported. Concatenating the
+    chunks gives the file. Raises ValueError for unknown formats, columns or
+    filters, and ImportError for Parquet when pyarrow is missing.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    columns = export_columns(columns)
+    stmt = export_statement(user_id, columns, filters, export_format)
+    if export_format == 'parquet':
+        _pyarrow()
+
+    async for session in get_db(read_only=True, user_id=user_id):
+        if export_format == 'csv':
+            chunks = _csv_chunks(session, stmt, chunk_bytes)
+        else:
+            chunks = _parquet_chunks(session, stmt, columns, chunk_bytes)
+        async for chunk in chunks:
+            if chunk.row_count is not None:
+                metrics.increment(f'expense_export.{export_format}_rows', chunk.row_count)
+            yield chunk
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import exists, func, select
+from app.database import Expense, expense_tags
+
+
+def parse_datetime(key: str, value: str, end_of_day: bool = False) -> datetime:
+    """Parse an ISO 8601 date or datetime into the naive UTC form stored in the table.
+
+    A bare date used as an upper bound covers the whole day.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date for filter '{key}': {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def parse_int(key: str, value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid integer for filter '{key}': {value}")
+
+
+def parse_float(key: str, value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid number for filter '{key}': {value}")
+
+
+def parse_bool(key: str, value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean for filter '{key}': {value}")
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so value matches literally (use with escape='\\')."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _tag_ids_predicate(key: str, value: str):
+    tag_ids = [parse_int(key, part) for part in value.split(',') if part.strip()]
+    if not tag_ids:
+        raise ValueError(f"Filter '{key}' needs at least one tag id")
+    return exists(
+        select(expense_tags.c.expense_id).where(
+            expense_tags.c.expense_id == Expense.id,
+            expense_tags.c.tag_id.in_(tag_ids)
+        )
+    )
+
+
+# Well-known ListExpensesRequest.filters keys mapped to predicate builders.
+# Each predicate is served by one of the user_id-leading indexes declared on
+# the expenses and expense_tags tables.
+FILTERS = {
+    # expense_date >= value (ISO date or datetime)
+    'date_from': lambda key, value: Expense.expense_date >= parse_datetime(key, value),
+    # expense_date before value; a bare date includes that whole day
+    'date_to': lambda key, value: Expense.expense_date < parse_datetime(key, value, end_of_day=True),
+    'category_id': lambda key, value: Expense.category_id == parse_int(key, value),
+    # Comma-separated tag ids; matches expenses carrying any of them
+    'tag_ids': _tag_ids_predicate,
+    'is_paid': lambda key, value: Expense.is_paid == parse_bool(key, value),
+    'currency': lambda key, value: Expense.currency == value,
+    'amount_min': lambda key, value: Expense.total_amount >= parse_float(key, value),
+    'amount_max': lambda key, value: Expense.total_amount <= parse_float(key, value),
+    # Case-insensitive vendor name prefix
+    'vendor_prefix': lambda key, value: func.lower(Expense.vendor_name).like(
+        escape_like(value.lower()) + '%', escape='\\'
+    ),
+    # due_date strictly before value; expenses without a due date never match
+    'due_before': lambda key, value: Expense.due_date < parse_datetime(key, value),
+}
+
+
+def build_filter_predicates(filters: Optional[Dict[str, str]]) -> List:
+    """Turn a ListExpensesRequest.filters map into SQL predicates.
+
+    Raises ValueError for unknown keys or malformed values.
+    """
+    if not filters:
+        return []
+
+    unknown = sorted(set(filters) - set(FILTERS))
+    if unknown:
+        raise ValueError(f"Unsupported filter(s): {', '.join(unknown)}")
+
+    return [FILTERS[key](key, value) for key, value in sorted(filters.items())]
+
+
+def apply_filters(stmt, filters: Optional[Dict[str, str]]):
+    """Apply the filters map to a statement selecting from expenses."""
+    predicates = build_filter_predicates(filters)
+    if predicates:
+        stmt = stmt.filter(*predicates)
+    return stmt
@@ -0,0 +1,187 @@
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Date, and_, case, cast, delete, func, literal, or_, select, text, true
+from sqlalchemy.dialects.postgresql import insert
+from app.database import Expense, ExpenseDailyRollup
+
+RollupKey = Tuple[date, int, str]
+
+# Value columns of expense_daily_rollups, in the order deltas are kept
+ROLLUP_VALUES = ('sum_amount', 'sum_tax', 'count', 'unpaid_amount', 'unpaid_count')
+
+
+def rollup_row(expense) -> Tuple[RollupKey, Tuple[float, float, int, float, int]]:
+    """Rollup key and contribution of a single expense.
+
+    Accepts anything with the Expense attribute names, including the
+    ExpenseCreate model and snapshots taken before an update.
+    """
+    unpaid = not expense.is_paid
+    key = (expense.expense_date.date(), expense.category_id, expense.currency)
+    values = (
+        expense.total_amount,
+        expense.total_tax,
+        1,
+        expense.total_amount if unpaid else 0.0,
+        1 if unpaid else 0,
+    )
+    return key, values
+
+
+def rollup_deltas(old, new, deltas: Optional[Dict[RollupKey, List]] = None) -> Dict[RollupKey, List]:
+    """Rollup changes for an expense moving from old to new.
+
+    Pass None as old for a created expense and None as new for a deleted one.
+    Moves between days, categories or currencies become a decrement of the
+    old row and an increment of the new one. Pass deltas to accumulate the
+    changes of several expenses into one mapping.
+    """
+    deltas = {} if deltas is None else deltas
+    for expense, sign in ((old, -1), (new, 1)):
+        if expense is None:
+            continue
+        key, values = rollup_row(expense)
+        current = deltas.setdefault(key, [0.0, 0.0, 0, 0.0, 0])
+        for i, value in enumerate(values):
+            current[i] += sign * value
+    for key in [key for key, values in deltas.items() if not any(values)]:
+        del deltas[key]
+    return deltas
+
+
+def rollup_upsert(user_id: str, deltas: Dict[RollupKey, List]):
+    """Build the upsert adding rollup deltas, or None when there is nothing to add."""
+    if not deltas:
+        return None
+
+    stmt = insert(ExpenseDailyRollup).values([
+        {
+            'user_id': user_id,
+            'day': day,
+            'category_id': category_id,
+            'currency': currency,
+            **dict(zip(ROLLUP_VALUES, values)),
+        }
+        for (day, category_id, currency), values in sorted(deltas.items())
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[
+            ExpenseDailyRollup.user_id,
+            ExpenseDailyRollup.day,
+            ExpenseDailyRollup.category_id,
+            ExpenseDailyRollup.currency,
+        ],
+        set_={
+            name: getattr(ExpenseDailyRollup, name) + getattr(stmt.excluded, name)
+            for name in ROLLUP_VALUES
+        }
+    )
+
+
+async def apply_rollup_deltas(session, user_id: str, deltas: Dict[RollupKey, List]) -> None:
+    """Upsert rollup deltas within the caller's transaction."""
+    stmt = rollup_upsert(user_id, deltas)
+    if stmt is not None:
+        await session.execute(stmt)
+
+
+async def merge_category_rollups(session, source_id: int, target_id: int) -> None:
+    """Fold every user's rollup rows for one category into another's.
+
+    Used when all expenses of the source category move to the target; the
+    caller commits.
+    """
+    rollup = ExpenseDailyRollup
+    source = select(
+        rollup.user_id,
+        rollup.day,
+        literal(target_id),
+        rollup.currency,
+        *[getattr(rollup, name) for name in ROLLUP_VALUES]
+    ).filter(rollup.category_id == source_id)
+    columns = ['user_id', 'day', 'category_id', 'currency', *ROLLUP_VALUES]
+    stmt = insert(rollup).from_select(columns, source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.user_id, rollup.day, rollup.category_id, rollup.currency],
+        set_={
+            name: getattr(rollup, name) + getattr(stmt.excluded, name)
+            for name in ROLLUP_VALUES
+        }
+    )
+    await session.execute(stmt)
+    await session.execute(delete(rollup).filter(rollup.category_id == source_id))
+
+
+def _expected_rollups(user_id: Optional[str]):
+    """Select the rollup rows as recomputed from the expenses table."""
+    unpaid = ~func.coalesce(Expense.is_paid, False)
+    day = cast(Expense.expense_date, Date)
+    return select(
+        Expense.user_id.label('user_id'),
+        day.label('day'),
+        Expense.category_id.label('category_id'),
+        Expense.currency.label('currency'),
+        func.sum(Expense.total_amount).label('sum_amount'),
+        func.sum(Expense.total_tax).label('sum_tax'),
+        func.count().label('count'),
+        func.sum(case((unpaid, Expense.total_amount), else_=0.0)).label('unpaid_amount'),
+        func.sum(case((unpaid, 1), else_=0)).label('unpaid_count'),
+    ).filter(
+        Expense.user_id == user_id if user_id else true()
+    ).group_by(Expense.user_id, day, Expense.category_id, Expense.currency)
+
+
+async def rebuild_rollups(session, user_id: Optional[str] = None) -> int:
+    """Recompute daily rollups from the expenses table, for all users or one user.
+
+    Returns the number of rollup rows written. The caller commits. The
+    rollup table is locked for the duration so concurrent writes wait and
+    apply their deltas on top of the rebuilt values.
+    """
+    await session.execute(text('LOCK TABLE expense_daily_rollups IN EXCLUSIVE MODE'))
+
+    clear = delete(ExpenseDailyRollup)
+    if user_id:
+        clear = clear.filter(ExpenseDailyRollup.user_id == user_id)
+    await session.execute(clear)
+
+    columns = ['user_id', 'day', 'category_id', 'currency', *ROLLUP_VALUES]
+    result = await session.execute(
+        insert(ExpenseDailyRollup).from_select(columns, _expected_rollups(user_id))
+    )
+    return result.rowcount
+
+
+async def verify_rollups(session, user_id: Optional[str] = None, tolerance: float = 0.005) -> List:
+    """Compare the rollup table against the expenses table.
+
+    Returns the mismatching (user_id, day, category_id, currency) rows with
+    expected and actual values; an empty list means the rollups are exact.
+    """
+    expected = _expected_rollups(user_id).subquery('expected')
+    actual = select(ExpenseDailyRollup).filter(
+        ExpenseDailyRollup.count != 0,
+        ExpenseDailyRollup.user_id == user_id if user_id else true()
+    ).subquery('actual')
+
+    keys = ('user_id', 'day', 'category_id', 'currency')
+    on = and_(*[expected.c[key] == actual.c[key] for key in keys])
+    differs = or_(
+        expected.c.user_id.is_(None),
+        actual.c.user_id.is_(None),
+        expected.c['count'] != actual.c['count'],
+        expected.c.unpaid_count != actual.c.unpaid_count,
+        *[
+            func.abs(expected.c[name] - actual.c[name]) > tolerance
+            for name in ('sum_amount', 'sum_tax', 'unpaid_amount')
+        ]
+    )
+
+    stmt = select(
+        *[func.coalesce(expected.c[key], actual.c[key]).label(key) for key in keys],
+        *[expected.c[name].label(f'expected_{name}') for name in ROLLUP_VALUES],
+        *[actual.c[name].label(f'actual_{name}') for name in ROLLUP_VALUES],
+    ).select_from(expected.outerjoin(actual, on, full=True)).filter(differs)
+
+    result = await session.execute(stmt)
+    return list(result.all())
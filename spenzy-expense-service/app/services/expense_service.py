@@ -1,168 +1,923 @@
-from typing import List, Optional
-from datetime import datetime
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Collection, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from datetime import datetime, timedelta
 import logging
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
-from app.database import get_db, Expense, Category, Tag
+import os
+import re
+from sqlalchemy import DateTime, Integer, delete, exists, func, insert, literal, literal_column, select, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from app.database import commit, get_db, Expense, ExpenseTombstone, Category, Tag, expense_tags
 from app.models.expense import ExpenseCreate, ExpenseUpdate
+from app.services.category_cache import category_cache
+from app.services.expense_counters import (
+    apply_counter_deltas, counter_deltas, counter_key_for_filters, counter_upsert, get_counter
+)
+from app.services.expense_dates import expense_date_delete, expense_date_upsert, expense_with_id, expenses_with_ids
+from app.services.expense_events import expense_change_notice
+from app.services.expense_filters import apply_filters, build_filter_predicates
+from app.services.expense_rollups import apply_rollup_deltas, rollup_deltas, rollup_upsert
+from app.services.expense_tombstones import retention_cutoff, tombstone_insert
+from app.services.expense_versions import collection_version_token, expense_version_token
+from app.services.pagination import (
+    apply_keyset, decode_search_token, decode_sync_watermark, encode_page_token, encode_search_token,
+    encode_sync_watermark, get_sort_column
+)
+from app.services.tag_usage import link_deltas, tag_usage_update
+
+# Columns selected by the ORM-free listing path, in Expense proto order
+LIST_COLUMNS = (
+    Expense.id,
+    Expense.user_id,
+    Expense.expense_date,
+    Expense.vendor_name,
+    Expense.total_amount,
+    Expense.total_tax,
+    Expense.category_id,
+    Category.name.label('category_name'),
+    Expense.currency,
+    Expense.is_paid,
+    Expense.paid_on,
+    Expense.created_at,
+    Expense.updated_at,
+    Expense.due_date,
+)
+
+# Expense proto fields a read mask can select, with the columns that fill
+# them. category needs the categories join and tags a lookup of their own,
+# so both are skipped unless requested.
+FIELD_COLUMNS = {
+    'id': (Expense.id,),
+    'user_id': (Expense.user_id,),
+    'expense_date': (Expense.expense_date,),
+    'vendor_name': (Expense.vendor_name,),
+    'total_amount': (Expense.total_amount,),
+    'total_tax': (Expense.total_tax,),
+    'category_id': (Expense.category_id,),
+    'category': (Expense.category_id, Category.name.label('category_name')),
+    'currency': (Expense.currency,),
+    'is_paid': (Expense.is_paid,),
+    'paid_on': (Expense.paid_on,),
+    'created_at': (Expense.created_at,),
+    'created_by': (Expense.created_by,),
+    'updated_at': (Expense.updated_at,),
+    'updated_by': (Expense.updated_by,),
+    'tags': (),
+    'due_date': (Expense.due_date,),
+}
+
+# Fields returned when no read mask is given, i.e. LIST_COLUMNS and tags
+DEFAULT_FIELDS = frozenset(FIELD_COLUMNS) - {'created_by', 'updated_by'}
+
+
+def read_fields(paths: Collection[str]) -> FrozenSet[str]:
+    """Resolve read mask paths to Expense fields; no paths means DEFAULT_FIELDS.
+
+    The id is always included. Raises ValueError for unknown or nested paths.
+    """
+    if not paths:
+        return DEFAULT_FIELDS
+    unknown = sorted(set(paths) - set(FIELD_COLUMNS))
+    if unknown:
+        raise ValueError(f"Unsupported read_mask paths: {', '.join(unknown)}")
+    return frozenset(paths) | {'id'}
+
+
+def _projection(fields: Collection[str], *extra) -> List:
+    """Columns selecting the given fields plus extra ones, each column once."""
+    columns = {}
+    for field, field_columns in FIELD_COLUMNS.items():
+        if field in fields:
+            for column in field_columns:
+                columns.setdefault(column.key, column)
+    for column in extra:
+        columns.setdefault(column.key, column)
+    return list(columns.values())
+
+
+# Columns returned by the write paths; category_name comes from the category cache
+RETURNING_COLUMNS = tuple(column for column in LIST_COLUMNS if column.key != 'category_name')
+
+# Expense fields that feed the maintained counters and daily rollups
+AGGREGATE_FIELDS = ('is_paid', 'category_id', 'expense_date', 'currency', 'total_amount', 'total_tax')
+
+# updated_at is the database's now() when a write's transaction starts, not
+# when it commits, so a change can become visible with a timestamp slightly
+# older than ones already synced. Sync watermarks therefore never pass the
+# database's now() minus this window (which also covers replica lag); rows
+# inside it are sent again on the next sync.
+SYNC_SETTLE_SECONDS = float(os.getenv('EXPENSE_SYNC_SETTLE_SECONDS', '10'))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class SyncPage(NamedTuple):
+    rows: List
+    tags: Dict[int, List[Tuple[int, str]]]
+    deleted_ids: List[int]
+    watermark: str
+    has_more: bool
+    full_resync_required: bool
+
+
+def _aggregate_upserts(user_id: str, old, new) -> List:
+    """Counter and rollup upserts for one expense write, skipping empty ones.
+
+    old and new are the expense before and after the write (None for a
+    create or delete) and only need the Expense attribute names.
+    """
+    upserts = [
+        counter_upsert(user_id, counter_deltas(
+            (old.is_paid, old.category_id) if old is not None else None,
+            (new.is_paid, new.category_id) if new is not None else None
+        )),
+        rollup_upsert(user_id, rollup_deltas(old, new)),
+    ]
+    return [stmt for stmt in upserts if stmt is not None]
+
+
+def _current_tags(column):
+    """Correlated subquery aggregating a column of the expense's tags, ordered by name."""
+    return select(
+        func.array_agg(aggregate_order_by(column, Tag.name))
+    ).select_from(expense_tags).join(
+        Tag, Tag.id == expense_tags.c.tag_id
+    ).where(
+        expense_tags.c.expense_id == Expense.id
+    ).correlate(Expense).scalar_subquery()
+
+
+def _cascade_delete(stmt, user_id: str):
+    """Wrap an expenses DELETE ... RETURNING (including id) so it also deletes
+    the tag links, which have no foreign key into the partitioned table to
+    cascade from, and their expense_dates, leaves tombstones for SyncExpenses
+    and notifies watchers. Selects the rows the DELETE returned."""
+    deleted = stmt.cte('deleted_expenses')
+    links = delete(expense_tags).where(
+        expense_tags.c.expense_id.in_(select(deleted.c.id))
+    ).returning(expense_tags.c.tag_id).cte('deleted_links')
+    usage = tag_usage_update(link_deltas(links, -1)).cte('tag_usage')
+    dates = expense_date_delete(select(deleted.c.id))
+    tombstones = tombstone_insert(user_id, deleted.c.id)
+    notice = expense_change_notice(select(literal(user_id), deleted.c.id), deleted=True)
+    return select(deleted).add_cte(links).add_cte(usage).add_cte(dates.cte('deleted_dates')).add_cte(
+        tombstones.cte('tombstones')
+    ).add_cte(notice)
+
+
+def _notified(stmt, user_id: str, dated: bool = False):
+    """Wrap an expenses INSERT or UPDATE ... RETURNING (including id) so the
+    same statement notifies watchers of the written expenses and, when dated
+    (the write creates expenses or may change their dates, and returns
+    expense_date), records their dates in expense_dates. Selects the rows the
+    write returned."""
+    written = stmt.cte('written_expenses')
+    stmt = select(written).add_cte(expense_change_notice(select(literal(user_id), written.c.id)))
+    if dated:
+        stmt = stmt.add_cte(expense_date_upsert(select(written.c.id, written.c.expense_date)).cte('written_dates'))
+    return stmt
+
+
+def _sync_position(previous, last, settled, more: bool):
+    """Position the next sync resumes from in one of its (timestamp, id) streams.
+
+    Normally just after the last row returned, but held back to the settled
+    point so late commits are not skipped. With more pages to come the
+    position must move past the page regardless, and it never moves back.
+    """
+    if more:
+        return last
+    position = min(last, settled) if last is not None else settled
+    return max(previous, position) if previous is not None else position
+
+
+def _with_aggregates(stmt, upserts: List):
+    """Attach upserts to stmt as data-modifying CTEs, so they run in its round trip."""
+    for index, upsert in enumerate(upserts):
+        stmt = stmt.add_cte(upsert.cte(f'aggregate_upsert_{index}'))
+    return stmt
+
+
 class ExpenseService:
-    async def get_expense(self, user_id: str, expense_id: int) -> Optional[Expense]:
-        """Get an expense by ID."""
-        async for session in get_db():
-            stmt = select(Expense).options(
-                joinedload(Expense.category),
-                joinedload(Expense.tags)
-            ).filter(
-                Expense.user_id == user_id,
-                Expense.id == expense_id
-            )
-            result = await session.execute(stmt)
-            return result.unique().scalar_one_or_none()
+    def _page_statement(
+        self,
+        stmt,
+        page: int,
+        page_size: int,
+        sort_by: str,
+        ascending: bool,
+        page_token: Optional[str],
+        filters: Optional[Dict[str, str]]
+    ):
+        """Apply filters, ordering and the page window to a listing statement.
+
+        One extra row is requested so the caller can tell whether a next page
+        exists without a separate count.
+        """
+        # Apply filters
+        stmt = apply_filters(stmt, filters)
+
+        # Apply sorting, seeking past the token if one was given
+        stmt = apply_keyset(stmt, sort_by, ascending, page_token)
+
+        # Apply pagination, fetching one extra row to detect a next page
+        if not page_token:
+            stmt = stmt.offset((max(page, 1) - 1) * page_size)
+        return stmt.limit(page_size + 1)
+
+    def _split_page(self, items: List, page_size: int, sort_by: str, ascending: bool):
+        """Trim the look-ahead row and build the next page token from the last item."""
+        if len(items) > page_size:
+            items = items[:page_size]
+            return items, encode_page_token(sort_by, ascending, items[-1])
+        return items, None
+
+    async def _load_tag_rows(self, session, expense_ids: List[int]) -> Dict[int, List[Tuple[int, str]]]:
+        """Fetch (tag id, tag name) pairs for a set of expenses with one IN query."""
+        tags_by_expense: Dict[int, List[Tuple[int, str]]] = {}
+        if not expense_ids:
+            return tags_by_expense
 
-    async def list_expenses(
+        stmt = select(expense_tags.c.expense_id, Tag.id, Tag.name).join(
+            Tag, Tag.id == expense_tags.c.tag_id
+        ).filter(
+            expense_tags.c.expense_id.in_(expense_ids)
+        ).order_by(expense_tags.c.expense_id, Tag.name)
+        for expense_id, tag_id, tag_name in await session.execute(stmt):
+            tags_by_expense.setdefault(expense_id, []).append((tag_id, tag_name))
+        return tags_by_expense
+
+    def _projected_select(self, user_id: str, fields: Collection[str], *extra):
+        """SELECT of a user's expenses limited to the columns of the requested fields."""
+        stmt = select(*_projection(fields, *extra))
+        if 'category' in fields:
+            stmt = stmt.join(Category, Category.id == Expense.category_id)
+        return stmt.filter(Expense.user_id == user_id)
+
+    async def _load_projected_tags(self, session, fields: Collection[str], rows) -> Dict[int, List[Tuple[int, str]]]:
+        if 'tags' not in fields:
+            return {}
+        return await self._load_tag_rows(session, [row.id for row in rows])
+
+    async def list_expense_rows(
         self,
         user_id: str,
         page: int = 1,
         page_size: int = 10,
         sort_by: str = 'expense_date',
-        ascending: bool = False
-    ) -> List[Expense]:
-        """List expenses with pagination and sorting."""
-        logger.info(f"Listing expenses for user_id: {user_id}, page: {page}, page_size: {page_size}")
-        offset = (page - 1) * page_size
+        ascending: bool = False,
+        page_token: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None,
+        fields: Collection[str] = DEFAULT_FIELDS
+    ) -> Tuple[List, Dict[int, List[Tuple[int, str]]], Optional[str]]:
+        """List expenses as plain column rows, without ORM hydration.
 
-        async for session in get_db():
-            try:
-                stmt = select(Expense).options(
-                    joinedload(Expense.category),
-                    joinedload(Expense.tags)
-                ).filter(
-                    Expense.user_id == user_id
-                )
+        When page_token is given the page is located with a keyset seek on
+        (sort column, id) instead of OFFSET, so deep pages cost the same as the
+        first one. Returns rows with the columns of the requested fields (see
+        read_fields) plus the sort column, a mapping of expense id to its
+        (tag id, tag name) pairs loaded with a single IN query when tags are
+        requested, and the next page token.
+        """
+        logger.info(f"Listing expense rows for user_id: {user_id}, page: {page}, page_size: {page_size}")
 
-                # Apply sorting
-                if ascending:
-                    stmt = stmt.order_by(getattr(Expense, sort_by).asc())
-                else:
-                    stmt = stmt.order_by(getattr(Expense, sort_by).desc())
+        async for session in get_db(read_only=True, user_id=user_id):
+            try:
+                stmt = self._projected_select(user_id, fields, get_sort_column(sort_by))
+                stmt = self._page_statement(stmt, page, page_size, sort_by, ascending, page_token, filters)
 
-                # Apply pagination
-                stmt = stmt.offset(offset).limit(page_size)
-                
-                logger.info(f"Executing query: {stmt}")
                 result = await session.execute(stmt)
-                expenses = list(result.unique().scalars().all())
-                logger.info(f"Found {len(expenses)} expenses")
-                
-                return expenses
+                rows, next_page_token = self._split_page(list(result.all()), page_size, sort_by, ascending)
+                tags_by_expense = await self._load_projected_tags(session, fields, rows)
+
+                logger.info(f"Found {len(rows)} expenses")
+                return rows, tags_by_expense, next_page_token
             except Exception as e:
                 logger.error(f"Error listing expenses: {str(e)}", exc_info=True)
                 raise
 
-    async def create_expense(self, user_id: str, expense: ExpenseCreate) -> Expense:
-        """Create a new expense."""
-        db_expense = Expense(
-            user_id=user_id,
-            expense_date=expense.expense_date,
-            vendor_name=expense.vendor_name,
-            total_amount=expense.total_amount,
-            total_tax=expense.total_tax,
-            category_id=expense.category_id,
-            currency=expense.currency,
-            is_paid=expense.is_paid,
-            paid_on=expense.paid_on if expense.is_paid else None,
-            due_date=expense.due_date,
-            created_by=user_id,
-            updated_by=user_id
+    async def stream_expense_rows(
+        self,
+        user_id: str,
+        sort_by: str = 'expense_date',
+        ascending: bool = False,
+        filters: Optional[Dict[str, str]] = None,
+        batch_size: int = 500,
+        fields: Collection[str] = DEFAULT_FIELDS
+    ) -> AsyncIterator[Tuple[List, Dict[int, List[Tuple[int, str]]]]]:
+        """Stream all matching expense rows in batches from a server-side cursor.
+
+        Yields (rows, tags by expense id) per batch, in the shape returned by
+        list_expense_rows. Rows are plain tuples and tags are loaded per batch
+        with one IN query, so memory stays bounded by batch_size rather than
+        by the size of the history.
+        """
+        async for session in get_db(read_only=True, user_id=user_id):
+            stmt = self._projected_select(user_id, fields)
+            stmt = apply_filters(stmt, filters)
+            stmt = apply_keyset(stmt, sort_by, ascending, None)
+
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            async for partition in result.partitions():
+                rows = list(partition)
+                yield rows, await self._load_projected_tags(session, fields, rows)
+
+    async def search_expense_rows(
+        self,
+        user_id: str,
+        query: str,
+        page_size: int = 20,
+        page_token: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None
+    ) -> Tuple[List, Dict[int, List[Tuple[int, str]]], Optional[str]]:
+        """Full-text search over vendor names and stored document text.
+
+        Every word of the query must match the start of a word in the vendor
+        name or the document text. Results are ranked with vendor matches
+        weighted above document matches and paged by a keyset on (rank, id),
+        served from the (user_id, search_vector) GIN index. Returns rows in the
+        list_expense_rows shape plus a rank column, tags and the next token.
+        """
+        terms = re.findall(r'\w+', query.lower())
+        if not terms:
+            raise ValueError("Search query has no searchable words")
+        normalized = ' '.join(terms)
+        tsquery = func.to_tsquery(
+            literal_column("'simple'"), ' & '.join(f"{term}:*" for term in terms)
         )
+        rank = func.ts_rank(Expense.search_vector, tsquery)
+
+        async for session in get_db(read_only=True, user_id=user_id):
+            stmt = select(*LIST_COLUMNS, rank.label('rank')).join(
+                Category, Category.id == Expense.category_id
+            ).filter(
+                Expense.user_id == user_id,
+                Expense.search_vector.op('@@')(tsquery)
+            )
+            stmt = apply_filters(stmt, filters)
+            if page_token:
+                last_rank, last_id = decode_search_token(page_token, normalized)
+                stmt = stmt.filter(tuple_(rank, Expense.id) < tuple_(last_rank, last_id))
+            stmt = stmt.order_by(rank.desc(), Expense.id.desc()).limit(page_size + 1)
+
+            rows = list((await session.execute(stmt)).all())
+            next_page_token = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_page_token = encode_search_token(normalized, rows[-1].rank, rows[-1].id)
+            return rows, await self._load_tag_rows(session, [row.id for row in rows]), next_page_token
+
+    async def sync_expense_rows(self, user_id: str, watermark: Optional[str] = None, page_size: int = 500) -> SyncPage:
+        """Expenses changed and deleted since a sync watermark.
+
+        Changed rows come in (updated_at, id) order from the (user_id,
+        updated_at, id) index, deleted ids in (deleted_at, expense_id) order
+        from the tombstones, up to page_size of each. The returned watermark
+        resumes both; has_more means the caller should sync again right away.
+        Without a watermark every expense is returned, paged the same way.
+        A watermark older than the tombstone retention sets
+        full_resync_required, as deletes since then may have been pruned.
+        """
+        if watermark:
+            changed, deleted = decode_sync_watermark(watermark)
+            if deleted[0] < retention_cutoff():
+                return SyncPage([], {}, [], '', False, True)
+
+        async for session in get_db(read_only=True, user_id=user_id):
+            # From the database clock that stamps updated_at and deleted_at,
+            # whatever the app server's clock says
+            settled_at = await session.scalar(select(func.now() - timedelta(seconds=SYNC_SETTLE_SECONDS)))
+            settled = (settled_at, 0)
+            if not watermark:
+                # Nothing deleted before a first sync concerns its client
+                changed, deleted = None, settled
+
+            stmt = select(*LIST_COLUMNS).join(
+                Category, Category.id == Expense.category_id
+            ).filter(
+                Expense.user_id == user_id
+            )
+            if changed is not None:
+                stmt = stmt.filter(tuple_(Expense.updated_at, Expense.id) > tuple_(*changed))
+            stmt = stmt.order_by(Expense.updated_at, Expense.id).limit(page_size + 1)
+            rows = list((await session.execute(stmt)).all())
+
+            stmt = select(ExpenseTombstone.deleted_at, ExpenseTombstone.expense_id).filter(
+                ExpenseTombstone.user_id == user_id,
+                tuple_(ExpenseTombstone.deleted_at, ExpenseTombstone.expense_id) > tuple_(*deleted)
+            ).order_by(ExpenseTombstone.deleted_at, ExpenseTombstone.expense_id).limit(page_size + 1)
+            tombstones = list((await session.execute(stmt)).all())
+
+            more_rows, more_tombstones = len(rows) > page_size, len(tombstones) > page_size
+            rows, tombstones = rows[:page_size], tombstones[:page_size]
+            changed = _sync_position(
+                changed, (rows[-1].updated_at, rows[-1].id) if rows else None, settled, more_rows
+            )
+            deleted = _sync_position(
+                deleted, tuple(tombstones[-1]) if tombstones else None, settled, more_tombstones
+            )
+            return SyncPage(
+                rows,
+                await self._load_tag_rows(session, [row.id for row in rows]),
+                [tombstone.expense_id for tombstone in tombstones],
+                encode_sync_watermark(changed, deleted),
+                more_rows or more_tombstones,
+                False
+            )
+
+    async def count_expenses(self, user_id: str, filters: Optional[Dict[str, str]] = None) -> int:
+        """Count a user's expenses matching the filters.
+
+        Unfiltered, is_paid-only and category_id-only counts are answered from
+        the maintained expense_counters rows; other combinations fall back to
+        an index-backed COUNT over the matching rows.
+        """
+        async for session in get_db(read_only=True, user_id=user_id):
+            key = counter_key_for_filters(filters)
+            if key is not None:
+                return await get_counter(session, user_id, key)
+
+            stmt = apply_filters(
+                select(func.count()).select_from(Expense).filter(Expense.user_id == user_id),
+                filters
+            )
+            return (await session.execute(stmt)).scalar_one()
+
+    async def _category_name(self, category_id: int) -> str:
+        """Name of a category from the cache; ValueError if it does not exist."""
+        category = await category_cache.get(category_id)
+        if category is None:
+            raise ValueError(f"Category {category_id} not found")
+        return category.name
+
+    async def _link_tags(self, session, user_id: str, expense_id: int, tag_ids: List[int]) -> List[Tuple[int, str]]:
+        """Make tag_ids the expense's exact tag set in one statement.
+
+        Links to other tags are deleted and missing ones inserted through
+        data-modifying CTEs, which also adjust the tags' usage counts; ids
+        that are not the user's tags are ignored.
+        Returns the resulting (tag id, tag name) pairs ordered by name.
+        """
+        wanted = select(Tag.id).filter(Tag.id.in_(tag_ids), Tag.user_id == user_id)
+        removed = delete(expense_tags).filter(
+            expense_tags.c.expense_id == expense_id,
+            expense_tags.c.tag_id.not_in(wanted)
+        ).returning(expense_tags.c.tag_id).cte('removed_links')
+        added = insert(expense_tags).from_select(
+            ['expense_id', 'tag_id'],
+            select(literal(expense_id), Tag.id).filter(
+                Tag.id.in_(wanted),
+                ~exists().where(
+                    expense_tags.c.expense_id == expense_id,
+                    expense_tags.c.tag_id == Tag.id
+                )
+            )
+        ).returning(expense_tags.c.tag_id).cte('added_links')
+        usage = tag_usage_update(link_deltas(added, 1), link_deltas(removed, -1)).cte('tag_usage')
+        stmt = select(Tag.id, Tag.name).filter(Tag.id.in_(wanted)).order_by(Tag.name)
+        result = await session.execute(stmt.add_cte(removed).add_cte(added).add_cte(usage))
+        return [tuple(row) for row in result]
+
+    async def create_expense(self, user_id: str, expense: ExpenseCreate) -> Tuple[Any, List[Tuple[int, str]]]:
+        """Create a new expense.
+
+        The INSERT ... RETURNING carries the counter and rollup upserts and the
+        change notice as CTEs, so an expense without tags is written in one
+        statement; linking tags takes one more. Returns the expense as a LIST_COLUMNS-shaped row
+        and its (tag id, tag name) pairs.
+        """
+        category_name = await self._category_name(expense.category_id)
+        values = {
+            'user_id': user_id,
+            'expense_date': expense.expense_date,
+            'vendor_name': expense.vendor_name,
+            'total_amount': expense.total_amount,
+            'total_tax': expense.total_tax,
+            'category_id': expense.category_id,
+            'currency': expense.currency,
+            'is_paid': expense.is_paid,
+            'paid_on': expense.paid_on if expense.is_paid else None,
+            'due_date': expense.due_date,
+            'document_text': expense.document_text,
+            'created_by': user_id,
+            'updated_by': user_id,
+        }
 
         async for session in get_db():
             try:
-                # Get tags if provided
+                stmt = _notified(insert(Expense).values(values).returning(*RETURNING_COLUMNS), user_id, dated=True)
+                stmt = _with_aggregates(stmt, _aggregate_upserts(user_id, None, expense))
+                row = (await session.execute(stmt)).one()
+
+                tags = []
                 if expense.tag_ids:
-                    stmt = select(Tag).filter(
-                        Tag.id.in_(expense.tag_ids),
-                        Tag.user_id == user_id
-                    )
-                    result = await session.execute(stmt)
-                    tags = result.scalars().all()
-                    db_expense.tags.extend(tags)  # Use extend to add tags to the relationship
-
-                session.add(db_expense)
-                await session.commit()
-                await session.refresh(db_expense, ['category', 'tags'])
-                return db_expense
+                    tags = await self._link_tags(session, user_id, row.id, expense.tag_ids)
+
+                await commit(session)
+                return SimpleNamespace(**row._mapping, category_name=category_name), tags
             except Exception as e:
                 logger.error(f"Error creating expense: {str(e)}", exc_info=True)
-                await session.rollback()
                 raise
 
-    async def update_expense(self, user_id: str, expense_id: int, expense: ExpenseUpdate) -> Optional[Expense]:
-        """Update an expense."""
+    async def create_expenses(
+        self,
+        user_id: str,
+        expenses: List[ExpenseCreate]
+    ) -> List[Tuple[Optional[int], Optional[str]]]:
+        """Create many expenses in one transaction.
+
+        All rows are validated up front with one category and one tag lookup,
+        the valid ones are written with a single multi-row INSERT ... RETURNING,
+        their tag links with one bulk insert into expense_tags, and the
+        counter and rollup upserts with the change notice and expense_dates
+        rows in one statement. Returns an
+        (expense id, error message) pair per input row, in input order.
+        """
+        results: List[Tuple[Optional[int], Optional[str]]] = [(None, None)] * len(expenses)
+        if not expenses:
+            return results
+
         async for session in get_db():
-            # Get existing expense
-            stmt = select(Expense).options(
-                joinedload(Expense.category),
-                joinedload(Expense.tags)
-            ).filter(
-                Expense.id == expense_id,
-                Expense.user_id == user_id
-            )
-            result = await session.execute(stmt)
-            db_expense = result.unique().scalar_one_or_none()
-
-            if not db_expense:
-                return None
-
-            # Update fields
-            update_data = expense.model_dump(exclude_unset=True)
-            
-            # Handle special cases
-            if 'is_paid' in update_data:
-                if not update_data['is_paid']:
-                    update_data['paid_on'] = None
-                elif 'paid_on' not in update_data:
-                    update_data['paid_on'] = datetime.utcnow()
-
-            # Update tags if provided
-            if 'tag_ids' in update_data:
-                stmt = select(Tag).filter(
-                    Tag.id.in_(update_data['tag_ids']),
-                    Tag.user_id == user_id
+            try:
+                category_ids = {expense.category_id for expense in expenses}
+                stmt = select(Category.id).filter(Category.id.in_(category_ids))
+                known_categories = set((await session.execute(stmt)).scalars().all())
+
+                tag_ids = {tag_id for expense in expenses for tag_id in expense.tag_ids}
+                known_tags = set()
+                if tag_ids:
+                    stmt = select(Tag.id).filter(Tag.id.in_(tag_ids), Tag.user_id == user_id)
+                    known_tags = set((await session.execute(stmt)).scalars().all())
+
+                valid = []
+                for index, expense in enumerate(expenses):
+                    if expense.category_id not in known_categories:
+                        results[index] = (None, f"Category {expense.category_id} not found")
+                        continue
+                    missing_tags = sorted(set(expense.tag_ids) - known_tags)
+                    if missing_tags:
+                        results[index] = (None, f"Tags not found: {', '.join(map(str, missing_tags))}")
+                        continue
+                    valid.append(index)
+
+                if not valid:
+                    return results
+
+                rows = [
+                    {
+                        'user_id': user_id,
+                        'expense_date': expenses[index].expense_date,
+                        'vendor_name': expenses[index].vendor_name,
+                        'total_amount': expenses[index].total_amount,
+                        'total_tax': expenses[index].total_tax,
+                        'category_id': expenses[index].category_id,
+                        'currency': expenses[index].currency,
+                        'is_paid': expenses[index].is_paid,
+                        'paid_on': expenses[index].paid_on if expenses[index].is_paid else None,
+                        'due_date': expenses[index].due_date,
+                        'document_text': expenses[index].document_text,
+                        'created_by': user_id,
+                        'updated_by': user_id,
+                    }
+                    for index in valid
+                ]
+                stmt = insert(Expense).returning(Expense.id, sort_by_parameter_order=True)
+                new_ids = (await session.execute(stmt, rows)).scalars().all()
+
+                links = []
+                deltas = Counter()
+                daily_deltas = {}
+                for index, expense_id in zip(valid, new_ids):
+                    results[index] = (expense_id, None)
+                    expense = expenses[index]
+                    links.extend(
+                        {'expense_id': expense_id, 'tag_id': tag_id}
+                        for tag_id in dict.fromkeys(expense.tag_ids)
+                    )
+                    deltas.update(counter_deltas(None, (expense.is_paid, expense.category_id)))
+                    rollup_deltas(None, expense, daily_deltas)
+
+                if links:
+                    await session.execute(insert(expense_tags), links)
+                # Every created expense counts towards the user's total, so
+                # there is always a counter upsert to carry the change notice
+                upserts = [counter_upsert(user_id, dict(deltas)), rollup_upsert(user_id, daily_deltas)]
+                upserts = [stmt for stmt in upserts if stmt is not None]
+                new_id = func.unnest(literal(list(new_ids), ARRAY(Integer)))
+                new_date = func.unnest(literal([expenses[index].expense_date for index in valid], ARRAY(DateTime)))
+                notice = expense_change_notice(select(literal(user_id), new_id))
+                dates = expense_date_upsert(select(new_id, new_date)).cte('written_dates')
+                stmt = _with_aggregates(upserts[-1], upserts[:-1]).add_cte(notice).add_cte(dates)
+                if links:
+                    usage = Counter(link['tag_id'] for link in links)
+                    stmt = stmt.add_cte(tag_usage_update(select(
+                        func.unnest(literal(list(usage), ARRAY(Integer))),
+                        func.unnest(literal(list(usage.values()), ARRAY(Integer)))
+                    )).cte('tag_usage'))
+                await session.execute(stmt)
+                await commit(session)
+                return results
+            except Exception as e:
+                logger.error(f"Error creating expenses: {str(e)}", exc_info=True)
+                raise
+
+    async def update_expense(
+        self,
+        user_id: str,
+        expense_id: int,
+        expense: ExpenseUpdate
+    ) -> Optional[Tuple[Any, List[Tuple[int, str]]]]:
+        """Update an expense.
+
+        One UPDATE ... FROM a FOR UPDATE subquery, which also notifies
+        watchers, returns both the updated row, with its current tags, and the
+        previous aggregate fields; the
+        counter and rollup deltas follow in one more statement when they
+        changed, and a new tag set in one more. Returns the expense as a
+        LIST_COLUMNS-shaped row and its (tag id, tag name) pairs, or None if
+        the expense does not exist.
+        """
+        update_data = expense.model_dump(exclude_unset=True)
+        tag_ids = update_data.pop('tag_ids', None)
+
+        # Handle special cases
+        if 'is_paid' in update_data:
+            if not update_data['is_paid']:
+                update_data['paid_on'] = None
+            elif 'paid_on' not in update_data:
+                update_data['paid_on'] = datetime.utcnow()
+        if 'category_id' in update_data:
+            await self._category_name(update_data['category_id'])
+
+        async for session in get_db():
+            try:
+                old = select(
+                    Expense.id, *[getattr(Expense, field) for field in AGGREGATE_FIELDS]
+                ).filter(
+                    expense_with_id(expense_id),
+                    Expense.user_id == user_id
+                ).with_for_update().subquery('old')
+
+                stmt = update(Expense).where(
+                    Expense.id == old.c.id, Expense.expense_date == old.c.expense_date
+                ).values(
+                    updated_by=user_id, **update_data
+                ).returning(
+                    *RETURNING_COLUMNS,
+                    *[old.c[field].label(f'old_{field}') for field in AGGREGATE_FIELDS],
+                    _current_tags(Tag.id).label('tag_ids'),
+                    _current_tags(Tag.name).label('tag_names'),
                 )
-                result = await session.execute(stmt)
-                tags = result.scalars().all()
-                db_expense.tags = tags
-                del update_data['tag_ids']
+                stmt = _notified(stmt, user_id, dated='expense_date' in update_data)
+                row = (await session.execute(stmt)).one_or_none()
 
-            # Always update updated_by
-            update_data['updated_by'] = user_id
+                if row is None:
+                    return None
 
-            # Update fields
-            for field, value in update_data.items():
-                setattr(db_expense, field, value)
+                values = row._mapping
+                previous = SimpleNamespace(**{field: values[f'old_{field}'] for field in AGGREGATE_FIELDS})
+                upserts = _aggregate_upserts(user_id, previous, row)
+                if upserts:
+                    await session.execute(_with_aggregates(upserts[-1], upserts[:-1]))
 
-            await session.commit()
-            await session.refresh(db_expense, ['category', 'tags'])
-            return db_expense
+                if tag_ids is not None:
+                    tags = await self._link_tags(session, user_id, expense_id, tag_ids)
+                else:
+                    tags = list(zip(values['tag_ids'] or [], values['tag_names'] or []))
+
+                await commit(session)
+                expense_row = SimpleNamespace(
+                    **{column.key: values[column.key] for column in RETURNING_COLUMNS},
+                    category_name=await self._category_name(row.category_id)
+                )
+                return expense_row, tags
+            except Exception as e:
+                logger.error(f"Error updating expense: {str(e)}", exc_info=True)
+                raise
 
     async def delete_expense(self, user_id: str, expense_id: int) -> bool:
-        """Delete an expense."""
+        """Delete an expense and its tag links with one statement, plus the aggregate upserts."""
         async for session in get_db():
-            stmt = select(Expense).filter(
-                Expense.id == expense_id,
-                Expense.user_id == user_id
-            )
-            result = await session.execute(stmt)
-            db_expense = result.scalar_one_or_none()
+            try:
+                stmt = delete(Expense).filter(
+                    expense_with_id(expense_id),
+                    Expense.user_id == user_id
+                ).returning(Expense.id, *[getattr(Expense, field) for field in AGGREGATE_FIELDS])
+                row = (await session.execute(_cascade_delete(stmt, user_id))).one_or_none()
 
-            if db_expense:
-                await session.delete(db_expense)
-                await session.commit()
+                if row is None:
+                    return False
+
+                upserts = _aggregate_upserts(user_id, row, None)
+                if upserts:
+                    await session.execute(_with_aggregates(upserts[-1], upserts[:-1]))
+                await commit(session)
                 return True
-            return False 
\ No newline at end of file
+            except Exception as e:
+                logger.error(f"Error deleting expense: {str(e)}", exc_info=True)
+                raise
+
+    def _selection(self, user_id: str, ids: List[int], filters: Optional[Dict[str, str]]) -> List:
+        """Predicates selecting a user's expenses by id list, filters or both.
+
+        Raises ValueError when neither is given, so a bulk call can never touch
+        every expense by accident.
+        """
+        if not ids and not filters:
+            raise ValueError("Select expenses by ids or filters")
+        predicates = [Expense.user_id == user_id]
+        if ids:
+            predicates.append(expenses_with_ids(ids))
+        return predicates + build_filter_predicates(filters)
+
+    def _locked_keys(self, predicates: List):
+        """Subquery of the (id, expense_date) keys of the selected expenses,
+        row-locked in id order; the date keeps the outer write to their partitions.
+
+        Locking in a fixed order keeps concurrent bulk calls over overlapping
+        rows from deadlocking each other.
+        """
+        return select(Expense.id, Expense.expense_date).filter(*predicates).order_by(Expense.id).with_for_update()
+
+    async def _update_selected(self, session, user_id: str, predicates: List, values: Dict) -> List[int]:
+        """Apply values to the selected expenses with one UPDATE ... RETURNING.
+
+        The selected rows are locked in id order by a FOR UPDATE subquery that
+        also carries their previous values, so the counter and rollup deltas
+        come back with the updated rows in the same round trip, which also
+        notifies watchers. Returns the ids of the updated expenses.
+        """
+        old = select(
+            Expense.id, *[getattr(Expense, field) for field in AGGREGATE_FIELDS]
+        ).filter(*predicates).order_by(Expense.id).with_for_update(of=Expense).subquery('old')
+
+        stmt = update(Expense).where(Expense.id == old.c.id, Expense.expense_date == old.c.expense_date).values(
+            updated_by=user_id, **values
+        ).returning(
+            Expense.id,
+            *[getattr(Expense, field) for field in AGGREGATE_FIELDS],
+            *[old.c[field].label(f'old_{field}') for field in AGGREGATE_FIELDS]
+        )
+        rows = (await session.execute(_notified(stmt, user_id))).all()
+
+        deltas = Counter()
+        daily_deltas = {}
+        for row in rows:
+            previous = SimpleNamespace(**{field: row._mapping[f'old_{field}'] for field in AGGREGATE_FIELDS})
+            current = SimpleNamespace(**{field: row._mapping[field] for field in AGGREGATE_FIELDS})
+            deltas.update(counter_deltas(
+                (previous.is_paid, previous.category_id), (current.is_paid, current.category_id)
+            ))
+            rollup_deltas(previous, current, daily_deltas)
+        await apply_counter_deltas(session, user_id, {key: delta for key, delta in deltas.items() if delta})
+        await apply_rollup_deltas(session, user_id, daily_deltas)
+        return [row.id for row in rows]
+
+    async def mark_expenses_paid(
+        self,
+        user_id: str,
+        ids: List[int],
+        filters: Optional[Dict[str, str]],
+        is_paid: bool,
+        paid_on: Optional[datetime] = None
+    ) -> List[int]:
+        """Mark the selected expenses paid or unpaid; returns the affected ids.
+
+        Only expenses whose is_paid changes are updated and returned, so the
+        ones already in that state keep their paid_on and version. Newly paid
+        expenses get paid_on, defaulting to now; unpaid ones lose it.
+        """
+        values = {'is_paid': is_paid, 'paid_on': (paid_on or datetime.utcnow()) if is_paid else None}
+        predicates = self._selection(user_id, ids, filters) + [Expense.is_paid.is_distinct_from(is_paid)]
+        async for session in get_db():
+            affected = await self._update_selected(session, user_id, predicates, values)
+            await commit(session)
+            return affected
+
+    async def recategorize_expenses(
+        self,
+        user_id: str,
+        ids: List[int],
+        filters: Optional[Dict[str, str]],
+        category_id: int
+    ) -> List[int]:
+        """Move the selected expenses to another category; returns the affected ids.
+
+        Expenses already in the category are left alone and not returned.
+        """
+        if await category_cache.get(category_id) is None:
+            raise ValueError(f"Category {category_id} not found")
+
+        predicates = self._selection(user_id, ids, filters) + [Expense.category_id != category_id]
+        async for session in get_db():
+            affected = await self._update_selected(session, user_id, predicates, {'category_id': category_id})
+            await commit(session)
+            return affected
+
+    async def retag_expenses(
+        self,
+        user_id: str,
+        ids: List[int],
+        filters: Optional[Dict[str, str]],
+        add_tag_ids: List[int],
+        remove_tag_ids: List[int]
+    ) -> List[int]:
+        """Add and remove tags on the selected expenses; returns the affected ids.
+
+        The expenses are touched with one UPDATE ... RETURNING, then the links
+        are changed with one DELETE and one INSERT ... SELECT on expense_tags,
+        each adjusting the tags' usage counts through a CTE.
+        """
+        add_tag_ids = list(dict.fromkeys(add_tag_ids))
+        async for session in get_db():
+            if add_tag_ids:
+                stmt = select(Tag.id).filter(Tag.id.in_(add_tag_ids), Tag.user_id == user_id)
+                missing_tags = sorted(set(add_tag_ids) - set((await session.execute(stmt)).scalars().all()))
+                if missing_tags:
+                    raise ValueError(f"Tags not found: {', '.join(map(str, missing_tags))}")
+
+            stmt = update(Expense).filter(
+                tuple_(Expense.id, Expense.expense_date).in_(self._locked_keys(self._selection(user_id, ids, filters)))
+            ).values(updated_by=user_id).returning(Expense.id)
+            affected = list((await session.execute(_notified(stmt, user_id))).scalars().all())
+
+            if affected and remove_tag_ids:
+                removed = delete(expense_tags).filter(
+                    expense_tags.c.expense_id.in_(affected),
+                    expense_tags.c.tag_id.in_(remove_tag_ids)
+                ).returning(expense_tags.c.tag_id).cte('removed_links')
+                usage = tag_usage_update(link_deltas(removed, -1)).cte('tag_usage')
+                await session.execute(select(func.count()).select_from(removed).add_cte(usage))
+            if affected and add_tag_ids:
+                pairs = select(Expense.id, Tag.id).filter(
+                    expenses_with_ids(affected),
+                    Tag.id.in_(add_tag_ids),
+                    ~exists().where(
+                        expense_tags.c.expense_id == Expense.id,
+                        expense_tags.c.tag_id == Tag.id
+                    )
+                )
+                added = insert(expense_tags).from_select(
+                    ['expense_id', 'tag_id'], pairs
+                ).returning(expense_tags.c.tag_id).cte('added_links')
+                usage = tag_usage_update(link_deltas(added, 1)).cte('tag_usage')
+                await session.execute(select(func.count()).select_from(added).add_cte(usage))
+
+            await commit(session)
+            return affected
+
+    async def delete_expenses(self, user_id: str, ids: List[int], filters: Optional[Dict[str, str]]) -> List[int]:
+        """Delete the selected expenses and their tag links with one statement; returns their ids."""
+        async for session in get_db():
+            stmt = delete(Expense).filter(
+                tuple_(Expense.id, Expense.expense_date).in_(self._locked_keys(self._selection(user_id, ids, filters)))
+            ).returning(
+                Expense.id, *[getattr(Expense, field) for field in AGGREGATE_FIELDS]
+            )
+            rows = (await session.execute(_cascade_delete(stmt, user_id))).all()
+
+            deltas = Counter()
+            daily_deltas = {}
+            for row in rows:
+                deltas.update(counter_deltas((row.is_paid, row.category_id), None))
+                rollup_deltas(row, None, daily_deltas)
+            await apply_counter_deltas(session, user_id, dict(deltas))
+            await apply_rollup_deltas(session, user_id, daily_deltas)
+            await commit(session)
+            return [row.id for row in rows]
+
+    async def expense_version(self, user_id: str, expense_id: int) -> Optional[str]:
+        """Version token of an expense, read without loading it; None if it does not exist."""
+        async for session in get_db(read_only=True, user_id=user_id):
+            updated_at = await session.scalar(select(Expense.updated_at).filter(
+                expense_with_id(expense_id),
+                Expense.user_id == user_id
+            ))
+            return await expense_version_token(updated_at) if updated_at is not None else None
+
+    async def collection_version(self, user_id: str) -> str:
+        """Version token covering all of a user's expenses, for listings."""
+        async for session in get_db(read_only=True, user_id=user_id):
+            return await collection_version_token(session, user_id)
+
+    async def get_expense_rows(
+        self,
+        user_id: str,
+        ids: List[int],
+        fields: Collection[str] = DEFAULT_FIELDS
+    ) -> Tuple[List, Dict[int, List[Tuple[int, str]]]]:
+        """Load expenses by id as rows of the requested fields plus their tags, ordered by id.
+
+        Rows always carry updated_at, from which expense_version_token derives
+        their version.
+        """
+        if not ids:
+            return [], {}
+        async for session in get_db():
+            stmt = self._projected_select(user_id, fields, Expense.updated_at).filter(
+                expenses_with_ids(ids)
+            ).order_by(Expense.id)
+            rows = list((await session.execute(stmt)).all())
+            return rows, await self._load_projected_tags(session, fields, rows)
@@ -0,0 +1,31 @@
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, insert, literal, select
+from app.database import ExpenseTombstone
+
+# Days tombstones are kept; sync watermarks older than that are expired
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('EXPENSE_TOMBSTONE_RETENTION_DAYS', '90'))
+
+
+def retention_cutoff(retention_days: int = TOMBSTONE_RETENTION_DAYS) -> datetime:
+    """Deletion time before which tombstones may already have been pruned."""
+    return datetime.now(timezone.utc) - timedelta(days=retention_days)
+
+
+def tombstone_insert(user_id: str, expense_ids):
+    """INSERT of tombstones for a selectable of deleted expense ids.
+
+    Meant to run as a data-modifying CTE next to the DELETE returning the ids.
+    """
+    return insert(ExpenseTombstone).from_select(
+        ['expense_id', 'user_id', 'deleted_at'],
+        select(expense_ids, literal(user_id), func.now())
+    )
+
+
+async def prune_tombstones(session, retention_days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    """Delete tombstones older than the retention period; returns how many."""
+    result = await session.execute(
+        delete(ExpenseTombstone).filter(ExpenseTombstone.deleted_at < retention_cutoff(retention_days))
+    )
+    return result.rowcount
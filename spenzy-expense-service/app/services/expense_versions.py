@@ -0,0 +1,42 @@
+from datetime import datetime
+from sqlalchemy import literal, select
+from sqlalchemy.dialects.postgresql import insert
+from app.database import ExpenseCollectionVersion
+from app.services.category_cache import category_cache
+
+
+def collection_version_bump(user_ids):
+    """Upsert incrementing the collection version of every user selected.
+
+    user_ids is a SELECT of one column of distinct user ids; users are
+    bumped in that order.
+    """
+    stmt = insert(ExpenseCollectionVersion).from_select(
+        ['user_id', 'version'], user_ids.add_columns(literal(1))
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[ExpenseCollectionVersion.user_id],
+        set_={'version': ExpenseCollectionVersion.version + 1}
+    )
+
+
+async def get_collection_version(session, user_id: str) -> int:
+    """The user's collection version; 0 before their first write."""
+    version = await session.scalar(
+        select(ExpenseCollectionVersion.version).filter(ExpenseCollectionVersion.user_id == user_id)
+    )
+    return version or 0
+
+
+async def collection_version_token(session, user_id: str) -> str:
+    """Version token for a user's expense listings.
+
+    Categories are part of every listed expense, so the token also changes
+    with them.
+    """
+    return f"c{await get_collection_version(session, user_id)}-{await category_cache.version()}"
+
+
+async def expense_version_token(updated_at: datetime) -> str:
+    """Version token for one expense, from its updated_at and the categories."""
+    return f"e{int(updated_at.timestamp() * 1_000_000)}-{await category_cache.version()}"
@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+from sqlalchemy import tuple_
+from app.database import Expense
+
+# Columns that ListExpenses may sort by. Each one is backed by a composite
+# (user_id, <column>, id) index on the expenses table so that both offset and
+# keyset pages can be served from an index range scan.
+SORTABLE_COLUMNS = {
+    'expense_date': Expense.expense_date,
+    'created_at': Expense.created_at,
+    'updated_at': Expense.updated_at,
+    'total_amount': Expense.total_amount,
+    'vendor_name': Expense.vendor_name,
+}
+
+DEFAULT_SORT_COLUMN = 'expense_date'
+
+
+def get_sort_column(sort_by: Optional[str]):
+    """Resolve a sort_by name to its Expense column."""
+    sort_by = sort_by or DEFAULT_SORT_COLUMN
+    if sort_by not in SORTABLE_COLUMNS:
+        raise ValueError(f"Unsupported sort_by: {sort_by}")
+    return SORTABLE_COLUMNS[sort_by]
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(sort_by: str, value: Any) -> Any:
+    if value is None:
+        raise ValueError("Invalid page token")
+    if sort_by in ('expense_date', 'created_at', 'updated_at'):
+        return datetime.fromisoformat(value)
+    if sort_by == 'total_amount':
+        return float(value)
+    return str(value)
+
+
+def encode_page_token(sort_by: str, ascending: bool, expense: Expense) -> str:
+    """Build an opaque continuation token pointing just past the given expense."""
+    return _encode_payload({
+        's': sort_by,
+        'a': ascending,
+        'v': _encode_value(getattr(expense, sort_by)),
+        'id': expense.id,
+    })
+
+
+def _encode_payload(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_payload(token: str) -> dict:
+    padded = token + '=' * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+
+
+def decode_page_token(token: str, sort_by: str, ascending: bool) -> Tuple[Any, int]:
+    """Decode a continuation token into its (sort value, expense id) position.
+
+    The token must have been issued for the same sort column and direction,
+    otherwise the position it describes is meaningless.
+    """
+    try:
+        payload = _decode_payload(token)
+        token_sort_by = payload['s']
+        token_ascending = bool(payload['a'])
+        value = _decode_value(token_sort_by, payload['v'])
+        last_id = int(payload['id'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid page token") from e
+
+    if token_sort_by != sort_by or token_ascending != ascending:
+        raise ValueError("Page token does not match the requested sort order")
+    return value, last_id
+
+
+def apply_keyset(stmt, sort_by: str, ascending: bool, page_token: Optional[str]):
+    """Order a statement by (sort column, id) and seek past the page token."""
+    column = get_sort_column(sort_by)
+    if ascending:
+        stmt = stmt.order_by(column.asc(), Expense.id.asc())
+    else:
+        stmt = stmt.order_by(column.desc(), Expense.id.desc())
+
+    if page_token:
+        value, last_id = decode_page_token(page_token, sort_by, ascending)
+        position = tuple_(column, Expense.id)
+        if ascending:
+            stmt = stmt.filter(position > tuple_(value, last_id))
+        else:
+            stmt = stmt.filter(position < tuple_(value, last_id))
+    return stmt
+
+
+def encode_search_token(query: str, rank: float, expense_id: int) -> str:
+    """Build a continuation token for SearchExpenses, which orders by (rank, id) descending."""
+    return _encode_payload({'q': query, 'r': rank, 'id': expense_id})
+
+
+def decode_search_token(token: str, query: str) -> Tuple[float, int]:
+    """Decode a SearchExpenses token into its (rank, expense id) position."""
+    try:
+        payload = _decode_payload(token)
+        token_query = payload['q']
+        rank = float(payload['r'])
+        last_id = int(payload['id'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid page token") from e
+
+    if token_query != query:
+        raise ValueError("Page token does not match the search query")
+    return rank, last_id
+
+
+def encode_sync_watermark(changed: Tuple[datetime, int], deleted: Tuple[datetime, int]) -> str:
+    """Build a SyncExpenses watermark from the (updated_at, id) position reached
+    in expenses and the (deleted_at, expense_id) position reached in tombstones."""
+    return _encode_payload({
+        'u': changed[0].isoformat(),
+        'i': changed[1],
+        'd': deleted[0].isoformat(),
+        't': deleted[1],
+    })
+
+
+def decode_sync_watermark(watermark: str) -> Tuple[Tuple[datetime, int], Tuple[datetime, int]]:
+    """Decode a SyncExpenses watermark into its expense and tombstone positions."""
+    try:
+        payload = _decode_payload(watermark)
+        changed = (datetime.fromisoformat(payload['u']), int(payload['i']))
+        deleted = (datetime.fromisoformat(payload['d']), int(payload['t']))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid sync watermark") from e
+    return changed, deleted
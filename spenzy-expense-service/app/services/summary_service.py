@@ -0,0 +1,151 @@
+from datetime import datetime, time
+from typing import List, Optional
+import logging
+from sqlalchemy import String, case, cast, func, literal_column, select
+from app.database import get_db, Expense, ExpenseDailyRollup, Category, Tag, expense_tags
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Groupings that can be answered from expense_daily_rollups
+ROLLUP_GROUPINGS = ('category', 'month', 'currency')
+
+
+class SummaryService:
+    def _group_columns(self, group_by: str):
+        """Return (key, label) expressions and the joins needed for a grouping."""
+        if group_by == 'category':
+            return cast(Expense.category_id, String), Category.name, [(Category, Category.id == Expense.category_id)]
+        if group_by == 'month':
+            # Literal arguments keep the SELECT and GROUP BY expressions identical;
+            # bound parameters would make Postgres treat them as different
+            month = func.to_char(
+                func.date_trunc(literal_column("'month'"), Expense.expense_date),
+                literal_column("'YYYY-MM'")
+            )
+            return month, month, []
+        if group_by == 'currency':
+            return Expense.currency, Expense.currency, []
+        if group_by == 'vendor':
+            return Expense.vendor_name, Expense.vendor_name, []
+        if group_by == 'tag':
+            return cast(Tag.id, String), Tag.name, [
+                (expense_tags, expense_tags.c.expense_id == Expense.id),
+                (Tag, Tag.id == expense_tags.c.tag_id),
+            ]
+        raise ValueError(f"Unsupported group_by: {group_by}")
+
+    def _summary_query(
+        self,
+        user_id: str,
+        group_by: str,
+        date_from: Optional[datetime],
+        date_to: Optional[datetime]
+    ):
+        """Build the GROUP BY query over the expenses table."""
+        key, label, joins = self._group_columns(group_by)
+        paid = func.coalesce(Expense.is_paid, False)
+
+        stmt = select(
+            key.label('key'),
+            label.label('label'),
+            Expense.currency.label('currency'),
+            func.sum(Expense.total_amount).label('total_amount'),
+            func.sum(Expense.total_tax).label('total_tax'),
+            func.count().label('expense_count'),
+            func.sum(case((paid, Expense.total_amount), else_=0)).label('paid_amount'),
+            func.sum(case((paid, 0), else_=Expense.total_amount)).label('unpaid_amount'),
+            func.sum(case((paid, 1), else_=0)).label('paid_count'),
+            func.sum(case((paid, 0), else_=1)).label('unpaid_count'),
+        ).select_from(Expense)
+        for target, onclause in joins:
+            stmt = stmt.join(target, onclause)
+
+        stmt = stmt.filter(Expense.user_id == user_id)
+        if date_from:
+            stmt = stmt.filter(Expense.expense_date >= date_from)
+        if date_to:
+            stmt = stmt.filter(Expense.expense_date < date_to)
+
+        return stmt.group_by(key, label, Expense.currency).order_by(key, Expense.currency)
+
+    def _rollup_summary_query(
+        self,
+        user_id: str,
+        group_by: str,
+        date_from: Optional[datetime],
+        date_to: Optional[datetime]
+    ):
+        """Build the same summary from expense_daily_rollups."""
+        rollup = ExpenseDailyRollup
+        joins = []
+        if group_by == 'category':
+            key, label = cast(rollup.category_id, String), Category.name
+            joins.append((Category, Category.id == rollup.category_id))
+        elif group_by == 'month':
+            key = label = func.to_char(rollup.day, literal_column("'YYYY-MM'"))
+        else:
+            key = label = rollup.currency
+
+        total_count = func.sum(rollup.count)
+        stmt = select(
+            key.label('key'),
+            label.label('label'),
+            rollup.currency.label('currency'),
+            func.sum(rollup.sum_amount).label('total_amount'),
+            func.sum(rollup.sum_tax).label('total_tax'),
+            total_count.label('expense_count'),
+            func.sum(rollup.sum_amount - rollup.unpaid_amount).label('paid_amount'),
+            func.sum(rollup.unpaid_amount).label('unpaid_amount'),
+            func.sum(rollup.count - rollup.unpaid_count).label('paid_count'),
+            func.sum(rollup.unpaid_count).label('unpaid_count'),
+        ).select_from(rollup)
+        for target, onclause in joins:
+            stmt = stmt.join(target, onclause)
+
+        stmt = stmt.filter(rollup.user_id == user_id)
+        if date_from:
+            stmt = stmt.filter(rollup.day >= date_from.date())
+        if date_to:
+            stmt = stmt.filter(rollup.day < date_to.date())
+
+        return stmt.group_by(key, label, rollup.currency).having(
+            total_count > 0
+        ).order_by(key, rollup.currency)
+
+    def _can_use_rollups(
+        self,
+        group_by: str,
+        date_from: Optional[datetime],
+        date_to: Optional[datetime]
+    ) -> bool:
+        """Rollups are per day, category and currency, so they can only answer
+        those groupings over whole-day ranges."""
+        if group_by not in ROLLUP_GROUPINGS:
+            return False
+        return all(bound is None or bound.time() == time.min for bound in (date_from, date_to))
+
+    async def get_spending_summary(
+        self,
+        user_id: str,
+        group_by: str,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> List:
+        """Aggregate a user's spending per group and currency.
+
+        Amounts are never summed across currencies, so every group is further
+        split by currency. Category, month and currency summaries over whole
+        days are read from the daily rollups; the rest aggregate expenses.
+        Returns rows with key, label, currency, total_amount, total_tax,
+        expense_count, paid_amount, unpaid_amount, paid_count and unpaid_count,
+        ordered by key and currency.
+        """
+        if self._can_use_rollups(group_by, date_from, date_to):
+            stmt = self._rollup_summary_query(user_id, group_by, date_from, date_to)
+        else:
+            stmt = self._summary_query(user_id, group_by, date_from, date_to)
+        async for session in get_db(read_only=True, user_id=user_id):
+            result = await session.execute(stmt)
+            return list(result.all())
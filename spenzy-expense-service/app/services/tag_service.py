@@ -1,46 +1,52 @@
+from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import select
-from app.database import get_db, Tag
+from sqlalchemy import and_, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from app.database import commit, get_db, Expense, Tag, expense_tags
+from app.services.expense_filters import escape_like
+from app.services.expense_dates import expenses_with_ids
+from app.services.expense_events import expense_change_notice
 
 class TagService:
-    async def get_tags(self, user_id: str, query: Optional[str] = None) -> List[Tag]:
-        """Get all tags for a user, optionally filtered by query."""
-        async for session in get_db():
+    async def get_tags(self, user_id: str, query: Optional[str] = None, limit: int = 0) -> List[Tag]:
+        """Get a user's tags, optionally only those whose name contains query.
+
+        Without a query tags are ordered by name. With one, tags whose name
+        starts with it come first, then those containing it elsewhere, each
+        most used first, which is what the tag picker's autocomplete wants.
+        Prefix matches are fetched first, from the prefix index, and the
+        trigram-backed substring search only runs to fill the rest of the
+        limit. A positive limit caps the result.
+        """
+        async for session in get_db(read_only=True, user_id=user_id):
             stmt = select(Tag).filter(Tag.user_id == user_id)
-            
-            if query:
-                stmt = stmt.filter(Tag.name.ilike(f"%{query}%"))
-                
-            stmt = stmt.order_by(Tag.name)
-            result = await session.execute(stmt)
-            return list(result.scalars().all())
+
+            if not query:
+                stmt = stmt.order_by(Tag.name)
+                if limit > 0:
+                    stmt = stmt.limit(limit)
+                result = await session.execute(stmt)
+                return list(result.scalars().all())
+
+            pattern = escape_like(query.lower())
+            name = func.lower(Tag.name)
+            starts = name.like(f"{pattern}%", escape='\\')
+            contains = name.like(f"%{pattern}%", escape='\\')
+            tags = []
+            for matches in (starts, and_(contains, ~starts)):
+                ranked = stmt.filter(matches).order_by(Tag.usage_count.desc(), Tag.name)
+                if limit > 0:
+                    if len(tags) >= limit:
+                        break
+                    ranked = ranked.limit(limit - len(tags))
+                result = await session.execute(ranked)
+                tags.extend(result.scalars().all())
+            return tags
 
     async def create_tag(self, user_id: str, name: str) -> Tag:
-        """Create a new tag."""
-        async for session in get_db():
-            # Check if tag already exists for this user
-            stmt = select(Tag).filter(
-                Tag.user_id == user_id,
-                Tag.name == name
-            )
-            result = await session.execute(stmt)
-            existing_tag = result.scalar_one_or_none()
-            
-            if existing_tag:
-                return existing_tag
-            
-            # Create new tag
-            tag = Tag(
-                name=name,
-                user_id=user_id,
-                created_by=user_id,
-                updated_by=user_id
-            )
-            
-            session.add(tag)
-            await session.commit()
-            await session.refresh(tag)
-            return tag
+        """Create a new tag, or return the user's existing tag with that name."""
+        tags = await self.get_or_create_tags(user_id, [name])
+        return tags[0]
 
     async def delete_tag(self, user_id: str, tag_id: int) -> bool:
         """Delete a tag."""
@@ -55,37 +61,53 @@ class TagService:
             if not tag:
                 return False
             
+            # Losing the tag changes its expenses, so they must show up in
+            # syncs and watches and invalidate the user's listing versions
+            touched = update(Expense).filter(
+                expenses_with_ids(select(expense_tags.c.expense_id).filter(expense_tags.c.tag_id == tag_id))
+            ).values(updated_by=user_id).returning(Expense.id).cte('touched_expenses')
+            await session.execute(
+                select(func.count()).select_from(touched).add_cte(
+                    expense_change_notice(select(literal(user_id), touched.c.id))
+                )
+            )
             await session.delete(tag)
-            await session.commit()
+            await commit(session)
             return True
 
     async def get_or_create_tags(self, user_id: str, tag_names: List[str]) -> List[Tag]:
-        """Get or create multiple tags by name."""
-        tags = []
+        """Get or create multiple tags by name, in input order without duplicates.
+
+        Missing tags are written with one INSERT ... ON CONFLICT DO NOTHING
+        RETURNING, so concurrent callers creating the same name do not fail
+        on the unique index; tags that already existed, or that a concurrent
+        transaction created first, are read back with one SELECT.
+        """
+        names = list(dict.fromkeys(tag_names))
+        if not names:
+            return []
+
         async for session in get_db():
-            for name in tag_names:
-                # Try to find existing tag
-                stmt = select(Tag).filter(
-                    Tag.user_id == user_id,
-                    Tag.name == name
-                )
-                result = await session.execute(stmt)
-                tag = result.scalar_one_or_none()
-                
-                if not tag:
-                    # Create new tag
-                    tag = Tag(
-                        name=name,
-                        user_id=user_id,
-                        created_by=user_id,
-                        updated_by=user_id
-                    )
-                    session.add(tag)
-                
-                tags.append(tag)
-            
-            await session.commit()
-            for tag in tags:
-                await session.refresh(tag)
-            
-            return tags 
\ No newline at end of file
+            now = datetime.utcnow()
+            stmt = insert(Tag).values([
+                {
+                    'name': name,
+                    'user_id': user_id,
+                    'created_at': now,
+                    'created_by': user_id,
+                    'updated_at': now,
+                    'updated_by': user_id,
+                }
+                for name in names
+            ]).on_conflict_do_nothing(
+                index_elements=[Tag.user_id, Tag.name]
+            ).returning(Tag)
+            tags_by_name = {tag.name: tag for tag in (await session.scalars(stmt)).all()}
+
+            existing = [name for name in names if name not in tags_by_name]
+            if existing:
+                stmt = select(Tag).filter(Tag.user_id == user_id, Tag.name.in_(existing))
+                tags_by_name.update((tag.name, tag) for tag in (await session.scalars(stmt)).all())
+
+            await commit(session)
+            return [tags_by_name[name] for name in names]
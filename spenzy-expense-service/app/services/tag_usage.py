@@ -0,0 +1,31 @@
+from sqlalchemy import func, literal, select, union_all, update
+from app.database import Tag
+
+
+def link_deltas(links, delta: int):
+    """SELECT of (tag id, delta) for each expense_tags row a data-modifying
+    CTE returned (its RETURNING must include tag_id)."""
+    return select(links.c.tag_id, literal(delta))
+
+
+def tag_usage_update(*deltas):
+    """UPDATE adding SELECTs of (tag id, delta) rows to the tags' usage_count.
+
+    Meant to run as a data-modifying CTE next to the writes that changed the
+    links. Deltas are summed per tag first, since a statement may update each
+    row only once, and the tags are locked in id order so concurrent writers
+    sharing tags do not deadlock.
+    """
+    changes = union_all(*deltas).subquery('tag_link_changes')
+    tag_id, delta = list(changes.c)
+    summed = select(
+        tag_id.label('tag_id'), func.sum(delta).label('delta')
+    ).group_by(tag_id).subquery('tag_usage_deltas')
+    locked = select(Tag.id, summed.c.delta).join(
+        summed, summed.c.tag_id == Tag.id
+    ).order_by(Tag.id).with_for_update(of=Tag).subquery('locked_tags')
+    return update(Tag).where(Tag.id == locked.c.id).values(
+        usage_count=Tag.usage_count + locked.c.delta,
+        # Counting links is not an edit of the tag
+        updated_at=Tag.updated_at
+    )
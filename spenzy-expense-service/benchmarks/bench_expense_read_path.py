@@ -0,0 +1,132 @@
+"""Compare the ORM and the column-row read paths behind ListExpenses.
+
+Walks BENCH_PAGES keyset pages for the seeded benchmark user three times:
+with the former ORM path replayed here (Expense objects with joined category
+and selectin-loaded tags, converted field by field), with list_expense_rows + _rows_to_protos (plain rows), and with the
+rows path projected to a list screen's read mask. Reports rows/sec, the
+memory allocated while building each page's protos and their encoded size.
+
+Usage (from the spenzy-expense-service directory):
+    python -m benchmarks.bench_expense_read_path
+"""
+import asyncio
+import os
+import time
+import tracemalloc
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from app.database import AsyncSessionLocal, Expense, init_db
+from app.grpc_services.expense_service import ExpenseServicer
+from app.services.expense_service import read_fields
+from app.services.pagination import apply_keyset, encode_page_token
+from proto import expense_pb2
+from benchmarks.bench_list_pagination import BENCH_USER, seed
+
+PAGE_SIZE = int(os.getenv('BENCH_PAGE_SIZE', '100'))
+BENCH_PAGES = int(os.getenv('BENCH_PAGES', '200'))
+SUMMARY_FIELDS = read_fields(['id', 'expense_date', 'vendor_name', 'total_amount', 'currency'])
+
+
+def expense_to_proto(expense):
+    expense_proto = expense_pb2.Expense(
+        id=expense.id,
+        user_id=expense.user_id,
+        vendor_name=expense.vendor_name,
+        total_amount=expense.total_amount,
+        total_tax=expense.total_tax,
+        category_id=expense.category_id,
+        currency=expense.currency,
+        is_paid=expense.is_paid
+    )
+    expense_proto.expense_date.FromDatetime(expense.expense_date)
+    if expense.paid_on:
+        expense_proto.paid_on.FromDatetime(expense.paid_on)
+    if expense.due_date:
+        expense_proto.due_date.FromDatetime(expense.due_date)
+    expense_proto.created_at.FromDatetime(expense.created_at)
+    expense_proto.updated_at.FromDatetime(expense.updated_at)
+    expense_proto.category.id = expense.category.id
+    expense_proto.category.name = expense.category.name
+    for tag in expense.tags:
+        expense_proto.tags.add(id=tag.id, name=tag.name)
+    return expense_proto
+
+
+async def orm_page(servicer, token):
+    async with AsyncSessionLocal() as session:
+        stmt = select(Expense).options(
+            joinedload(Expense.category, innerjoin=True),
+            selectinload(Expense.tags)
+        ).filter(Expense.user_id == BENCH_USER)
+        stmt = apply_keyset(stmt, 'expense_date', False, token).limit(PAGE_SIZE + 1)
+        expenses = list((await session.execute(stmt)).unique().scalars().all())
+    token = None
+    if len(expenses) > PAGE_SIZE:
+        expenses = expenses[:PAGE_SIZE]
+        token = encode_page_token('expense_date', False, expenses[-1])
+    return [expense_to_proto(expense) for expense in expenses], token
+
+
+async def rows_page(servicer, token):
+    rows, tags_by_expense, token = await servicer.expense_service.list_expense_rows(
+        BENCH_USER, page_size=PAGE_SIZE, page_token=token
+    )
+    return servicer._rows_to_protos(rows, tags_by_expense), token
+
+
+async def summary_page(servicer, token):
+    rows, tags_by_expense, token = await servicer.expense_service.list_expense_rows(
+        BENCH_USER, page_size=PAGE_SIZE, page_token=token, fields=SUMMARY_FIELDS
+    )
+    return servicer._rows_to_protos(rows, tags_by_expense, SUMMARY_FIELDS), token
+
+
+async def run(servicer, fetch_page, trace=False):
+    """Walk the pages once; returns (rows, seconds, summed per-page peak bytes, encoded bytes).
+
+    tracemalloc slows everything down, so timing and memory are measured in
+    separate passes.
+    """
+    token = None
+    total_rows = 0
+    allocated = 0
+    encoded = 0
+    started = time.perf_counter()
+    for _ in range(BENCH_PAGES):
+        if trace:
+            tracemalloc.start()
+        protos, token = await fetch_page(servicer, token)
+        if trace:
+            allocated += tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        total_rows += len(protos)
+        encoded += sum(proto.ByteSize() for proto in protos)
+        if not token:
+            break
+    return total_rows, time.perf_counter() - started, allocated, encoded
+
+
+async def main():
+    await init_db()
+    await seed()
+    servicer = ExpenseServicer()
+
+    # Warm up connections and statement caches for both paths
+    await orm_page(servicer, None)
+    await rows_page(servicer, None)
+    await summary_page(servicer, None)
+
+    print(f"page_size={PAGE_SIZE}, pages={BENCH_PAGES}")
+    print(f"{'path':>8} {'rows':>8} {'rows/sec':>12} {'peak KiB/page':>15} {'wire KiB/page':>15}")
+    for name, fetch_page in (('orm', orm_page), ('rows', rows_page), ('summary', summary_page)):
+        total_rows, elapsed, _, encoded = await run(servicer, fetch_page)
+        _, _, allocated, _ = await run(servicer, fetch_page, trace=True)
+        pages = max(total_rows // PAGE_SIZE, 1)
+        print(
+            f"{name:>8} {total_rows:>8} {total_rows / elapsed:>12.0f} "
+            f"{allocated / pages / 1024:>15.1f} {encoded / pages / 1024:>15.1f}"
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
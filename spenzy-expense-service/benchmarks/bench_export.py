@@ -0,0 +1,48 @@
+"""Time ExportExpenses over the seeded benchmark user in both formats.
+
+Reuses the BENCH_ROWS expenses seeded by bench_list_pagination and exports
+them whole as CSV and as Parquet, with every default column and with a
+narrow column selection, reporting rows per second and output size.
+
+Usage (from the spenzy-expense-service directory):
+    python -m benchmarks.bench_export
+"""
+import asyncio
+import time
+from app.database import init_db
+from app.services.expense_export import export_expenses
+from benchmarks.bench_list_pagination import BENCH_ROWS, BENCH_USER, seed
+
+COLUMN_SETS = {
+    'default': [],
+    'narrow': ['expense_date', 'vendor_name', 'total_amount', 'currency'],
+}
+REPEAT = 3
+
+
+async def time_export(export_format, columns):
+    samples = []
+    for _ in range(REPEAT):
+        size = rows = 0
+        started = time.perf_counter()
+        async for chunk in export_expenses(BENCH_USER, export_format, columns):
+            size += len(chunk.data)
+            rows = chunk.row_count or rows
+        samples.append(time.perf_counter() - started)
+    return min(samples), rows, size
+
+
+async def main():
+    await init_db()
+    await seed()
+
+    print(f"{BENCH_ROWS} rows, best of {REPEAT}")
+    print(f"{'format':>8} {'columns':>8} {'seconds':>9} {'rows/s':>10} {'MiB':>8}")
+    for export_format in ('csv', 'parquet'):
+        for name, columns in COLUMN_SETS.items():
+            seconds, rows, size = await time_export(export_format, columns)
+            print(f"{export_format:>8} {name:>8} {seconds:>9.2f} {rows / seconds:>10.0f} {size / 2 ** 20:>8.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
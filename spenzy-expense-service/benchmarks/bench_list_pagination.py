@@ -0,0 +1,102 @@
+"""Compare deep-page latency of offset and keyset pagination in ListExpenses.
+
+Seeds BENCH_ROWS expenses for a single benchmark user in the database
+configured through the usual DB_* environment variables, then times pages at
+increasing depths with both access paths.
+
+Usage (from the spenzy-expense-service directory):
+    python -m benchmarks.bench_list_pagination
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+from app.database import AsyncSessionLocal, Category, Expense, ExpenseDate, init_db
+from app.services.expense_service import ExpenseService
+
+BENCH_USER = os.getenv('BENCH_USER', 'bench-pagination-user')
+BENCH_ROWS = int(os.getenv('BENCH_ROWS', '100000'))
+PAGE_SIZE = int(os.getenv('BENCH_PAGE_SIZE', '20'))
+DEPTHS = [1, 10, 100, 1000, BENCH_ROWS // PAGE_SIZE - 1]
+REPEAT = 5
+
+
+async def seed():
+    async with AsyncSessionLocal() as session:
+        count = await session.scalar(
+            select(func.count()).select_from(Expense).filter(Expense.user_id == BENCH_USER)
+        )
+        if count == BENCH_ROWS:
+            return
+
+        seeded = select(Expense.id).filter(Expense.user_id == BENCH_USER)
+        await session.execute(delete(ExpenseDate).filter(ExpenseDate.expense_id.in_(seeded)))
+        await session.execute(delete(Expense).filter(Expense.user_id == BENCH_USER))
+        category_id = await session.scalar(select(Category.id).limit(1))
+        if category_id is None:
+            category = Category(name='Benchmark', created_by=BENCH_USER, updated_by=BENCH_USER)
+            session.add(category)
+            await session.flush()
+            category_id = category.id
+
+        start = datetime(2015, 1, 1)
+        now = datetime.utcnow()
+        for offset in range(0, BENCH_ROWS, 5000):
+            rows = [
+                {
+                    'user_id': BENCH_USER,
+                    'expense_date': start + timedelta(hours=i),
+                    'vendor_name': f'Vendor {i % 500}',
+                    'total_amount': float(i % 1000),
+                    'total_tax': 0.0,
+                    'category_id': category_id,
+                    'currency': 'TRY',
+                    'is_paid': i % 2 == 0,
+                    'created_at': now,
+                    'created_by': BENCH_USER,
+                    'updated_at': now,
+                    'updated_by': BENCH_USER,
+                }
+                for i in range(offset, min(offset + 5000, BENCH_ROWS))
+            ]
+            await session.execute(insert(Expense), rows)
+        await session.execute(insert(ExpenseDate).from_select(
+            ['expense_id', 'expense_date'],
+            select(Expense.id, Expense.expense_date).filter(Expense.user_id == BENCH_USER)
+        ))
+        await session.commit()
+
+
+async def time_page(service, **kwargs):
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        await service.list_expense_rows(BENCH_USER, page_size=PAGE_SIZE, **kwargs)
+        samples.append(time.perf_counter() - started)
+    return min(samples) * 1000
+
+
+async def main():
+    await init_db()
+    await seed()
+    service = ExpenseService()
+
+    # Walk the keyset chain once to collect the token for every depth
+    tokens = {1: None}
+    token = None
+    for page in range(2, max(DEPTHS) + 1):
+        _, _, token = await service.list_expense_rows(BENCH_USER, page_size=PAGE_SIZE, page_token=token)
+        if page in DEPTHS:
+            tokens[page] = token
+
+    print(f"{BENCH_ROWS} rows, page_size={PAGE_SIZE}, best of {REPEAT}")
+    print(f"{'page':>8} {'offset ms':>12} {'keyset ms':>12}")
+    for depth in DEPTHS:
+        offset_ms = await time_page(service, page=depth)
+        keyset_ms = await time_page(service, page_token=tokens[depth])
+        print(f"{depth:>8} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Time SearchExpenses queries over the seeded benchmark user.
+
+Reuses the BENCH_ROWS expenses seeded by bench_list_pagination (vendor
+names "Vendor 0" to "Vendor 499") and times the first page and a deep
+keyset page for a few queries of different selectivity.
+
+Usage (from the spenzy-expense-service directory):
+    python -m benchmarks.bench_search
+"""
+import asyncio
+import os
+import time
+from app.database import init_db
+from app.services.expense_service import ExpenseService
+from benchmarks.bench_list_pagination import BENCH_ROWS, BENCH_USER, seed
+
+PAGE_SIZE = int(os.getenv('BENCH_PAGE_SIZE', '20'))
+QUERIES = ['vendor 42', 'vendor 4', 'vendor', 'nomatch']
+DEEP_PAGE = 50
+REPEAT = 5
+
+
+async def time_search(service, query, page_token=None):
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        rows, _, token = await service.search_expense_rows(
+            BENCH_USER, query, page_size=PAGE_SIZE, page_token=page_token
+        )
+        samples.append(time.perf_counter() - started)
+    return min(samples) * 1000, rows, token
+
+
+async def main():
+    await init_db()
+    await seed()
+    service = ExpenseService()
+
+    print(f"{BENCH_ROWS} rows, page_size={PAGE_SIZE}, best of {REPEAT}")
+    print(f"{'query':>12} {'first ms':>10} {f'page {DEEP_PAGE} ms':>12}")
+    for query in QUERIES:
+        first_ms, _, token = await time_search(service, query)
+        deep_ms = None
+        for _ in range(DEEP_PAGE - 2):
+            if not token:
+                break
+            _, _, token = await service.search_expense_rows(
+                BENCH_USER, query, page_size=PAGE_SIZE, page_token=token
+            )
+        if token:
+            deep_ms, _, _ = await time_search(service, query, token)
+        deep = f"{deep_ms:>12.2f}" if deep_ms is not None else f"{'-':>12}"
+        print(f"{query:>12} {first_ms:>10.2f} {deep}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""Compare create/update/delete latency of the ORM and the RETURNING write paths.
+
+The ORM path replays what ExpenseService used to do (SELECT, setattr or
+session.delete, commit, refresh); the RETURNING path calls the current
+ExpenseService methods. Each operation is run BENCH_WRITES times per path
+against the database configured through the usual DB_* environment
+variables; the table shows median and p95 latency and the statements each
+operation sent, not counting BEGIN and COMMIT.
+
+Usage (from the spenzy-expense-service directory):
+    python -m benchmarks.bench_write_path
+"""
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import event, select
+from sqlalchemy.orm import joinedload, selectinload
+from app.database import AsyncSessionLocal, Category, Expense, Tag, engine, init_db
+from app.models.expense import ExpenseCreate, ExpenseUpdate
+from app.services.expense_service import AGGREGATE_FIELDS, ExpenseService, _aggregate_upserts
+from app.services.tag_service import TagService
+
+BENCH_USER = os.getenv('BENCH_USER', 'bench-write-user')
+BENCH_WRITES = int(os.getenv('BENCH_WRITES', '500'))
+
+statements = 0
+
+
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def _count_statement(*args):
+    global statements
+    statements += 1
+
+
+async def _apply_aggregates(session, old, new):
+    for stmt in _aggregate_upserts(BENCH_USER, old, new):
+        await session.execute(stmt)
+
+
+def _aggregate_fields(expense):
+    return SimpleNamespace(**{field: getattr(expense, field) for field in AGGREGATE_FIELDS})
+
+
+async def orm_create(expense: ExpenseCreate) -> int:
+    async with AsyncSessionLocal() as session:
+        db_expense = Expense(
+            user_id=BENCH_USER,
+            created_by=BENCH_USER,
+            updated_by=BENCH_USER,
+            **expense.model_dump(exclude={'tag_ids'})
+        )
+        if expense.tag_ids:
+            tags = await session.scalars(select(Tag).filter(Tag.id.in_(expense.tag_ids)))
+            db_expense.tags.extend(tags)
+        session.add(db_expense)
+        await _apply_aggregates(session, None, db_expense)
+        await session.commit()
+        await session.refresh(db_expense, ['category', 'tags'])
+        return db_expense.id
+
+
+async def orm_update(expense_id: int, update: ExpenseUpdate) -> None:
+    async with AsyncSessionLocal() as session:
+        stmt = select(Expense).options(
+            joinedload(Expense.category, innerjoin=True),
+            selectinload(Expense.tags)
+        ).filter(Expense.id == expense_id).with_for_update(of=Expense)
+        db_expense = (await session.execute(stmt)).unique().scalar_one()
+        previous = _aggregate_fields(db_expense)
+        for field, value in update.model_dump(exclude_unset=True).items():
+            setattr(db_expense, field, value)
+        await _apply_aggregates(session, previous, db_expense)
+        await session.commit()
+        await session.refresh(db_expense, ['category', 'tags'])
+
+
+async def orm_delete(expense_id: int) -> None:
+    async with AsyncSessionLocal() as session:
+        stmt = select(Expense).filter(Expense.id == expense_id).with_for_update(of=Expense)
+        db_expense = (await session.execute(stmt)).scalar_one()
+        await session.delete(db_expense)
+        await _apply_aggregates(session, db_expense, None)
+        await session.commit()
+
+
+async def measure(operation, arguments):
+    """Run operation once per argument tuple; returns (results, latencies, statements per call)."""
+    global statements
+    results, latencies = [], []
+    statements = 0
+    for args in arguments:
+        started = time.perf_counter()
+        results.append(await operation(*args))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies, statements / len(arguments)
+
+
+def report(name, latencies, per_call):
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{name:>18} {statistics.median(latencies):>10.2f} {p95:>10.2f} {per_call:>12.1f}")
+
+
+async def main():
+    await init_db()
+    service = ExpenseService()
+    async with AsyncSessionLocal() as session:
+        category_id = await session.scalar(select(Category.id).order_by(Category.id).limit(1))
+    if category_id is None:
+        raise SystemExit("Create at least one category before running this benchmark")
+    tag_ids = [tag.id for tag in await TagService().get_or_create_tags(BENCH_USER, ['bench-a', 'bench-b'])]
+
+    def new_expense(i, tags):
+        return ExpenseCreate(
+            expense_date=datetime(2024, 1, 1 + i % 28),
+            vendor_name=f'Vendor {i % 50}',
+            total_amount=float(i % 100),
+            total_tax=0.0,
+            category_id=category_id,
+            currency='TRY',
+            is_paid=False,
+            tag_ids=tag_ids if tags else []
+        )
+
+    paid = ExpenseUpdate(is_paid=True, paid_on=datetime.utcnow())
+    retag = ExpenseUpdate(tag_ids=tag_ids[:1])
+
+    async def returning_create(expense):
+        row, _ = await service.create_expense(BENCH_USER, expense)
+        return row.id
+
+    async def returning_update(expense_id, update):
+        await service.update_expense(BENCH_USER, expense_id, update)
+
+    async def returning_delete(expense_id):
+        await service.delete_expense(BENCH_USER, expense_id)
+
+    print(f"{BENCH_WRITES} writes per operation")
+    print(f"{'operation':>18} {'median ms':>10} {'p95 ms':>10} {'statements':>12}")
+    for path, create, update, remove in (
+        ('orm', orm_create, orm_update, orm_delete),
+        ('returning', returning_create, returning_update, returning_delete),
+    ):
+        ids, latencies, per_call = await measure(create, [(new_expense(i, False),) for i in range(BENCH_WRITES)])
+        report(f'{path} create', latencies, per_call)
+        tagged, latencies, per_call = await measure(create, [(new_expense(i, True),) for i in range(BENCH_WRITES)])
+        report(f'{path} create+tags', latencies, per_call)
+        _, latencies, per_call = await measure(update, [(expense_id, paid) for expense_id in ids])
+        report(f'{path} update', latencies, per_call)
+        if path == 'returning':
+            # The ORM replay does not handle tag_ids, so only the new path is timed
+            _, latencies, per_call = await measure(update, [(expense_id, retag) for expense_id in tagged])
+            report(f'{path} update+tags', latencies, per_call)
+        _, latencies, per_call = await measure(remove, [(expense_id,) for expense_id in ids + tagged])
+        report(f'{path} delete', latencies, per_call)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
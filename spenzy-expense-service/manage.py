@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+from dotenv import load_dotenv
+from app.database import AsyncSessionLocal, Expense, engine, init_db
+from app.partitions import PARTITION_MONTHS_AHEAD, ensure_partitions, partition_expenses
+from app.services.expense_counters import rebuild_counters
+from app.services.expense_rollups import rebuild_rollups, verify_rollups
+from app.services.expense_tombstones import TOMBSTONE_RETENTION_DAYS, prune_tombstones
+
+# Load environment variables
+load_dotenv()
+
+
+async def rebuild_counters_command(args):
+    """Recompute expense_counters from the expenses table."""
+    async with AsyncSessionLocal() as session:
+        written = await rebuild_counters(session, args.user_id)
+        await session.commit()
+    scope = f"user {args.user_id}" if args.user_id else "all users"
+    print(f"Rebuilt {written} expense counters for {scope}")
+
+
+async def backfill_rollups_command(args):
+    """Recompute expense_daily_rollups from the expenses table."""
+    async with AsyncSessionLocal() as session:
+        written = await rebuild_rollups(session, args.user_id)
+        await session.commit()
+    scope = f"user {args.user_id}" if args.user_id else "all users"
+    print(f"Wrote {written} daily rollup rows for {scope}")
+
+
+async def verify_rollups_command(args):
+    """Report rollup rows that disagree with the expenses table."""
+    async with AsyncSessionLocal() as session:
+        mismatches = await verify_rollups(session, args.user_id)
+    for row in mismatches:
+        print(
+            f"{row.user_id} {row.day} category={row.category_id} {row.currency}: "
+            f"expected count={row.expected_count} amount={row.expected_sum_amount}, "
+            f"found count={row.actual_count} amount={row.actual_sum_amount}"
+        )
+    print(f"{len(mismatches)} mismatching daily rollup rows")
+    if mismatches:
+        raise SystemExit(1)
+
+
+async def prune_tombstones_command(args):
+    """Delete expense tombstones older than the retention period."""
+    async with AsyncSessionLocal() as session:
+        pruned = await prune_tombstones(session, args.retention_days)
+        await session.commit()
+    print(f"Pruned {pruned} expense tombstones older than {args.retention_days} days")
+
+
+async def partition_expenses_command(args):
+    """Convert a plain expenses table into the monthly partitioned one."""
+    async with engine.begin() as conn:
+        moved = await partition_expenses(conn, Expense.__table__)
+    print(f"Moved {moved} expenses into monthly partitions")
+
+
+async def create_partitions_command(args):
+    """Create the missing monthly expense partitions."""
+    async with engine.begin() as conn:
+        created = await ensure_partitions(conn, months_ahead=args.months_ahead)
+    print(f"Created {len(created)} expense partitions")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Spenzy expense service maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = subparsers.add_parser('rebuild-counters', help="Recompute per-user expense counters")
+    rebuild.add_argument('--user-id', help="Only rebuild counters for this user")
+    rebuild.set_defaults(handler=rebuild_counters_command)
+
+    backfill = subparsers.add_parser('backfill-rollups', help="Recompute daily spend rollups")
+    backfill.add_argument('--user-id', help="Only rebuild rollups for this user")
+    backfill.set_defaults(handler=backfill_rollups_command)
+
+    verify = subparsers.add_parser('verify-rollups', help="Check daily spend rollups against expenses")
+    verify.add_argument('--user-id', help="Only verify rollups for this user")
+    verify.set_defaults(handler=verify_rollups_command)
+
+    prune = subparsers.add_parser('prune-tombstones', help="Delete expired expense tombstones")
+    prune.add_argument('--retention-days', type=int, default=TOMBSTONE_RETENTION_DAYS,
+                       help="Keep tombstones of expenses deleted within this many days")
+    prune.set_defaults(handler=prune_tombstones_command)
+
+    partition = subparsers.add_parser(
+        'partition-expenses', help="Move an unpartitioned expenses table into monthly partitions"
+    )
+    partition.set_defaults(handler=partition_expenses_command)
+
+    create = subparsers.add_parser('create-partitions', help="Create upcoming monthly expense partitions")
+    create.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD,
+                        help="Months after the current one to create partitions for")
+    create.set_defaults(handler=create_partitions_command)
+
+    args = parser.parse_args()
+    await init_db()
+    await args.handler(args)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
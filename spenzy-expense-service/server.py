@@ -11,7 +11,11 @@ from app.grpc_services.tag_service import TagServicer
 from spenzy_common.middleware.auth_interceptor import AuthInterceptor
 from app.grpc_services.auth_service import AuthService
 from proto import auth_pb2, auth_pb2_grpc
-from app.database import init_db
+from app.database import init_db, maintain_partitions, monitor_replica_lag, replica_engine
+from app.middleware.session_interceptor import SessionInterceptor
+from app.metrics import report_metrics
+from app.services.category_cache import category_cache
+from app.services.expense_events import expense_change_hub
 
 # Load environment variables
 load_dotenv()
@@ -28,9 +32,24 @@ async def serve():
         '/grpc.reflection.v1alpha.ServerReflection/ServerReflectionInfo'  # Exclude reflection service
     ]
 
-    # Initialize the gRPC server with message size limits and interceptor
+    # Methods that only read, and so may be served by the read replica
+    read_only_methods = [
+        '/expense.ExpenseService/GetExpense',
+        '/expense.ExpenseService/ListExpenses',
+        '/expense.ExpenseService/SearchExpenses',
+        '/expense.ExpenseService/SyncExpenses',
+        '/expense.ExpenseService/GetSpendingSummary',
+        '/expense.TagService/ListTags',
+        '/expense.CategoryService/GetCategory',
+        '/expense.CategoryService/ListCategories',
+    ]
+
+    # Initialize the gRPC server with message size limits and interceptors
     server = grpc.aio.server(
-        interceptors=[AuthInterceptor(excluded_methods=excluded_methods)],
+        interceptors=[
+            AuthInterceptor(excluded_methods=excluded_methods),
+            SessionInterceptor(read_only_methods=read_only_methods)
+        ],
         options=[
             ('grpc.max_send_message_length', 50 * 1024 * 1024),
             ('grpc.max_receive_message_length', 50 * 1024 * 1024)
@@ -70,6 +89,22 @@ async def serve():
     await server.start()
     print(f'Server started on port {port}')
 
+    # Periodically log pool and service metrics; 0 disables reporting
+    metrics_interval = float(os.getenv('METRICS_INTERVAL', '60'))
+    metrics_task = asyncio.create_task(report_metrics(metrics_interval)) if metrics_interval > 0 else None
+
+    # Keep the category cache coherent with changes made by other replicas
+    category_listener = asyncio.create_task(category_cache.listen())
+
+    # Deliver expense change notifications to WatchExpenses streams
+    expense_listener = asyncio.create_task(expense_change_hub.listen())
+
+    # Track replica lag so reads fall back to the primary when it lags behind
+    replica_monitor = asyncio.create_task(monitor_replica_lag()) if replica_engine is not None else None
+
+    # Keep monthly expense partitions created ahead of time
+    partition_maintainer = asyncio.create_task(maintain_partitions())
+
     # Handle shutdown gracefully
     shutdown_event = asyncio.Event()
 
@@ -85,6 +120,13 @@ async def serve():
         await shutdown_event.wait()
     finally:
         print("\nShutting down server...")
+        if metrics_task:
+            metrics_task.cancel()
+        category_listener.cancel()
+        expense_listener.cancel()
+        if replica_monitor:
+            replica_monitor.cancel()
+        partition_maintainer.cancel()
         # Shutdown the gRPC server
         await server.stop(5)  # 5 seconds grace period
         print("Server shutdown complete")
@@ -0,0 +1,116 @@
+"""Counter and rollup deltas, and the upserts that carry them as CTEs.
+
+Statements are compiled for Postgres and checked as SQL; no database is needed.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from app.database import Expense
+from app.services.expense_counters import counter_deltas, counter_upsert
+from app.services.expense_rollups import rollup_deltas, rollup_upsert
+from app.services.expense_service import _aggregate_upserts, _with_aggregates
+
+USER = 'user-1'
+
+
+def compile_sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def expense(**values):
+    fields = {
+        'expense_date': datetime(2024, 3, 5, 14, 30),
+        'category_id': 1,
+        'currency': 'EUR',
+        'total_amount': 20.0,
+        'total_tax': 2.0,
+        'is_paid': False,
+    }
+    fields.update(values)
+    return SimpleNamespace(**fields)
+
+
+def test_created_expense_counts_everywhere():
+    assert counter_deltas(None, (False, 3)) == {
+        ('all', ''): 1,
+        ('is_paid', 'false'): 1,
+        ('category_id', '3'): 1,
+    }
+
+
+def test_deleted_expense_uncounts_everywhere():
+    assert counter_deltas((True, 3), None) == {
+        ('all', ''): -1,
+        ('is_paid', 'true'): -1,
+        ('category_id', '3'): -1,
+    }
+
+
+def test_moved_expense_only_changes_what_moved():
+    assert counter_deltas((False, 3), (True, 3)) == {('is_paid', 'false'): -1, ('is_paid', 'true'): 1}
+    assert counter_deltas((False, 3), (False, 4)) == {('category_id', '3'): -1, ('category_id', '4'): 1}
+    assert counter_deltas((False, 3), (False, 3)) == {}
+
+
+def test_created_expense_rolls_up_into_its_day():
+    deltas = rollup_deltas(None, expense())
+
+    assert deltas == {(datetime(2024, 3, 5).date(), 1, 'EUR'): [20.0, 2.0, 1, 20.0, 1]}
+
+
+def test_paying_an_expense_only_moves_the_unpaid_totals():
+    deltas = rollup_deltas(expense(), expense(is_paid=True))
+
+    assert deltas == {(datetime(2024, 3, 5).date(), 1, 'EUR'): [0.0, 0.0, 0, -20.0, -1]}
+
+
+def test_moving_an_expense_between_days_moves_its_rollup():
+    deltas = rollup_deltas(expense(), expense(expense_date=datetime(2024, 3, 6)))
+
+    assert deltas == {
+        (datetime(2024, 3, 5).date(), 1, 'EUR'): [-20.0, -2.0, -1, -20.0, -1],
+        (datetime(2024, 3, 6).date(), 1, 'EUR'): [20.0, 2.0, 1, 20.0, 1],
+    }
+
+
+def test_accumulated_deltas_that_cancel_are_dropped():
+    deltas = rollup_deltas(None, expense())
+    rollup_deltas(expense(), None, deltas)
+
+    assert deltas == {}
+
+
+def test_nothing_to_add_builds_no_upsert():
+    assert counter_upsert(USER, {}) is None
+    assert rollup_upsert(USER, {}) is None
+    assert _aggregate_upserts(USER, expense(), expense()) == []
+
+
+def test_counter_rows_are_upserted_in_key_order():
+    sql = compile_sql(counter_upsert(USER, counter_deltas((False, 3), (True, 4))))
+
+    keys = ["'category_id', '3'", "'category_id', '4'", "'is_paid', 'false'", "'is_paid', 'true'"]
+    positions = [sql.find(key) for key in keys]
+    assert -1 not in positions
+    assert positions == sorted(positions)
+    assert 'ON CONFLICT (user_id, dimension, key) DO UPDATE SET count = (expense_counters.count + excluded.count)' in sql
+
+
+def test_rollup_upsert_adds_to_the_existing_day():
+    sql = compile_sql(rollup_upsert(USER, rollup_deltas(None, expense())))
+
+    assert 'ON CONFLICT (user_id, day, category_id, currency) DO UPDATE' in sql
+    assert 'unpaid_amount = (expense_daily_rollups.unpaid_amount + excluded.unpaid_amount)' in sql
+
+
+def test_aggregates_ride_along_as_ctes():
+    upserts = _aggregate_upserts(USER, expense(), expense(category_id=2, is_paid=True))
+    sql = compile_sql(_with_aggregates(select(Expense.id), upserts))
+
+    assert len(upserts) == 2
+    assert sql.startswith('WITH aggregate_upsert_0 AS')
+    assert 'aggregate_upsert_1 AS' in sql
+    assert 'INSERT INTO expense_counters' in sql
+    assert 'INSERT INTO expense_daily_rollups' in sql
+    assert sql.rstrip().endswith('FROM expenses')
@@ -0,0 +1,139 @@
+"""ListExpenses paging and tag loading, checked on the SQL sent to Postgres.
+
+No database is needed: the request session is replaced by a fake that
+compiles every statement for Postgres and answers the expense select and
+the tag lookup from in-memory rows.
+"""
+import asyncio
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql
+from app.database import _request_session
+from app.services.expense_service import ExpenseService, read_fields
+
+USER = 'user-1'
+PAGE_SIZE = 10
+
+
+def compile_sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+class FakeSession:
+    """Serves expense rows honouring LIMIT and tag rows honouring the IN list."""
+
+    def __init__(self, expense_count: int, tags_per_expense: int):
+        start = datetime(2024, 1, 1)
+        self.expenses = [
+            {'id': i, 'expense_date': start - timedelta(days=i), 'category_name': 'Food'}
+            for i in range(1, expense_count + 1)
+        ]
+        self.tags_per_expense = tags_per_expense
+        self.statements = []
+
+    async def execute(self, stmt):
+        sql = compile_sql(stmt)
+        self.statements.append(sql)
+        keys = list(stmt.selected_columns.keys())
+        if keys == ['expense_id', 'id', 'name']:
+            ids = [int(i) for i in re.search(r'expense_tags\.expense_id IN \(([^)]*)\)', sql).group(1).split(',')]
+            return [
+                (expense_id, expense_id * 100 + n, f'tag {n}')
+                for expense_id in ids for n in range(self.tags_per_expense)
+            ]
+
+        Row = namedtuple('Row', keys)
+        limit = int(re.search(r'LIMIT (\d+)', sql).group(1))
+        rows = [Row(**{key: expense.get(key) for key in keys}) for expense in self.expenses[:limit]]
+        return FakeResult(rows)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+def list_rows(session, **kwargs):
+    async def run():
+        token = _request_session.set(session)
+        try:
+            return await ExpenseService().list_expense_rows(USER, page_size=PAGE_SIZE, **kwargs)
+        finally:
+            _request_session.reset(token)
+    return asyncio.run(run())
+
+
+def test_page_size_is_exact_however_many_tags():
+    for tags_per_expense in (0, 1, 7):
+        session = FakeSession(expense_count=25, tags_per_expense=tags_per_expense)
+        rows, tags_by_expense, next_page_token = list_rows(session)
+
+        assert len(rows) == PAGE_SIZE
+        assert next_page_token is not None
+        assert all(len(tags_by_expense.get(row.id, [])) == tags_per_expense for row in rows)
+
+
+def test_last_page_has_no_token():
+    session = FakeSession(expense_count=PAGE_SIZE, tags_per_expense=3)
+    rows, _, next_page_token = list_rows(session)
+
+    assert len(rows) == PAGE_SIZE
+    assert next_page_token is None
+
+
+def test_limit_applies_to_the_expense_select_without_tag_joins():
+    session = FakeSession(expense_count=25, tags_per_expense=5)
+    list_rows(session)
+
+    expense_sql = session.statements[0]
+    assert f'LIMIT {PAGE_SIZE + 1}' in expense_sql
+    assert 'expense_tags' not in expense_sql
+    assert 'JOIN tags' not in expense_sql
+
+
+def test_keyset_page_seeks_on_the_expense_select():
+    session = FakeSession(expense_count=25, tags_per_expense=5)
+    _, _, next_page_token = list_rows(session)
+
+    session = FakeSession(expense_count=25, tags_per_expense=5)
+    list_rows(session, page_token=next_page_token)
+
+    expense_sql = session.statements[0]
+    assert '(expenses.expense_date, expenses.id) <' in expense_sql
+    assert 'OFFSET' not in expense_sql
+    assert f'LIMIT {PAGE_SIZE + 1}' in expense_sql
+    assert 'expense_tags' not in expense_sql
+
+
+def test_tag_filter_is_a_semi_join():
+    session = FakeSession(expense_count=25, tags_per_expense=5)
+    rows, _, _ = list_rows(session, filters={'tag_ids': '1,2'})
+
+    expense_sql = session.statements[0]
+    assert 'EXISTS (SELECT expense_tags.expense_id' in expense_sql
+    assert 'JOIN expense_tags' not in expense_sql
+    assert len(rows) == PAGE_SIZE
+
+
+def test_tags_load_with_one_in_query_per_page():
+    session = FakeSession(expense_count=25, tags_per_expense=5)
+    rows, _, _ = list_rows(session)
+
+    assert len(session.statements) == 2
+    tag_sql = session.statements[1]
+    in_list = re.search(r'expense_tags\.expense_id IN \(([^)]*)\)', tag_sql).group(1)
+    # Only the page's expenses, not the look-ahead row
+    assert [int(i) for i in in_list.split(',')] == [row.id for row in rows]
+
+
+def test_tags_are_not_loaded_when_masked_out():
+    session = FakeSession(expense_count=25, tags_per_expense=5)
+    rows, tags_by_expense, _ = list_rows(session, fields=read_fields(['id', 'vendor_name']))
+
+    assert len(session.statements) == 1
+    assert tags_by_expense == {}
+    assert len(rows) == PAGE_SIZE
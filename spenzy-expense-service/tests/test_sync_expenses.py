@@ -0,0 +1,159 @@
+"""SyncExpenses watermarks, checked without a database.
+
+The request session is replaced by a fake that answers the settle-time
+query from a database clock stopped at NOW, and the expense and tombstone selects
+from in-memory rows honouring LIMIT.
+"""
+import asyncio
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.dialects import postgresql
+from app.database import _request_session
+from app.services.expense_service import SYNC_SETTLE_SECONDS, ExpenseService, _sync_position
+from app.services.pagination import decode_sync_watermark, encode_sync_watermark
+
+USER = 'user-1'
+# Within tombstone retention, which is measured from the real clock
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+SETTLED = (NOW - timedelta(seconds=SYNC_SETTLE_SECONDS), 0)
+
+
+def compile_sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+class FakeSession:
+    """Serves changed expenses and tombstones, each as given, up to the LIMIT."""
+
+    def __init__(self, changed=(), deleted=()):
+        self.changed = list(changed)
+        self.deleted = list(deleted)
+        self.statements = []
+
+    async def scalar(self, stmt):
+        self.statements.append(compile_sql(stmt))
+        return NOW - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+    async def execute(self, stmt):
+        sql = compile_sql(stmt)
+        self.statements.append(sql)
+        keys = list(stmt.selected_columns.keys())
+        if keys == ['expense_id', 'id', 'name']:
+            return []
+
+        limit = int(re.search(r'LIMIT (\d+)', sql).group(1))
+        Row = namedtuple('Row', keys)
+        if keys == ['deleted_at', 'expense_id']:
+            rows = [Row(deleted_at, expense_id) for deleted_at, expense_id in self.deleted]
+        else:
+            rows = [
+                Row(**{key: {'id': expense_id, 'updated_at': updated_at}.get(key) for key in keys})
+                for updated_at, expense_id in self.changed
+            ]
+        return FakeResult(rows[:limit])
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+def sync(session, watermark=None, page_size=10):
+    async def run():
+        token = _request_session.set(session)
+        try:
+            return await ExpenseService().sync_expense_rows(USER, watermark, page_size)
+        finally:
+            _request_session.reset(token)
+    return asyncio.run(run())
+
+
+def seconds_ago(seconds: float) -> datetime:
+    return NOW - timedelta(seconds=seconds)
+
+
+def test_position_follows_a_full_page():
+    last = (seconds_ago(1), 7)
+    assert _sync_position((seconds_ago(60), 1), last, SETTLED, more=True) == last
+
+
+def test_position_is_held_back_to_the_settled_point():
+    previous = (seconds_ago(60), 1)
+    assert _sync_position(previous, (seconds_ago(1), 7), SETTLED, more=False) == SETTLED
+    assert _sync_position(previous, (seconds_ago(30), 7), SETTLED, more=False) == (seconds_ago(30), 7)
+
+
+def test_position_without_rows_moves_to_the_settled_point():
+    assert _sync_position(None, None, SETTLED, more=False) == SETTLED
+    assert _sync_position((seconds_ago(60), 1), None, SETTLED, more=False) == SETTLED
+
+
+def test_position_never_moves_back():
+    previous = (seconds_ago(5), 9)
+    assert _sync_position(previous, (seconds_ago(4), 10), SETTLED, more=False) == previous
+    assert _sync_position(previous, None, SETTLED, more=False) == previous
+
+
+def test_settle_time_comes_from_the_database_clock():
+    session = FakeSession()
+    sync(session)
+
+    assert 'now()' in session.statements[0]
+
+
+def test_first_sync_skips_earlier_tombstones():
+    session = FakeSession(changed=[(seconds_ago(60), 1)])
+    page = sync(session)
+
+    tombstone_sql = session.statements[2]
+    settled_at = SETTLED[0].strftime('%Y-%m-%d %H:%M:%S')
+    assert '(expense_tombstones.deleted_at, expense_tombstones.expense_id) >' in tombstone_sql
+    assert settled_at in tombstone_sql
+    assert [row.id for row in page.rows] == [1]
+    assert decode_sync_watermark(page.watermark) == ((seconds_ago(60), 1), SETTLED)
+    assert not page.has_more
+
+
+def test_recent_changes_are_sent_again():
+    changed = [(seconds_ago(60), 1), (seconds_ago(2), 2)]
+    page = sync(FakeSession(changed=changed))
+
+    assert [row.id for row in page.rows] == [1, 2]
+    assert decode_sync_watermark(page.watermark)[0] == SETTLED
+
+
+def test_full_page_moves_past_it_and_asks_for_more():
+    changed = [(seconds_ago(60 - i), i) for i in range(1, 5)]
+    page = sync(FakeSession(changed=changed), page_size=3)
+
+    assert [row.id for row in page.rows] == [1, 2, 3]
+    assert page.has_more
+    assert decode_sync_watermark(page.watermark)[0] == changed[2]
+
+
+def test_tombstones_resume_from_the_watermark():
+    watermark = encode_sync_watermark((seconds_ago(120), 4), (seconds_ago(90), 8))
+    deleted = [(seconds_ago(80), 9), (seconds_ago(70), 3)]
+    session = FakeSession(deleted=deleted)
+    page = sync(session, watermark)
+
+    tombstone_sql = session.statements[2]
+    assert seconds_ago(90).strftime('%Y-%m-%d %H:%M:%S') in tombstone_sql
+    assert page.deleted_ids == [9, 3]
+    changed, deleted_position = decode_sync_watermark(page.watermark)
+    assert changed == SETTLED
+    assert deleted_position == (seconds_ago(70), 3)
+
+
+def test_expired_watermark_requires_a_full_resync():
+    long_ago = NOW - timedelta(days=10000)
+    session = FakeSession()
+    page = sync(session, encode_sync_watermark((long_ago, 1), (long_ago, 1)))
+
+    assert page.full_resync_required
+    assert page.watermark == ''
+    assert session.statements == []